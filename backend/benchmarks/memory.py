@@ -0,0 +1,77 @@
+"""Memory per episode of a large library
+
+Run `PYTHONPATH=. python benchmarks/memory.py` from the backend directory
+to print the number for 50k episodes. It only uses the public item API, so
+it runs unchanged on older trees for a before/after comparison.
+"""
+
+import gc
+import json
+import sys
+import tracemalloc
+
+from program.media.item import Episode, Season, Show
+
+EPISODES = 50_000
+EPISODES_PER_SEASON = 20
+
+
+def episode_payload(number: int) -> str:
+    return json.dumps(
+        {
+            "number": number,
+            "title": f"Episode {number}",
+            "aired_at": "2009-09-10T00:00:00",
+            "network": "The CW",
+            "country": "us",
+            "language": "en",
+            "genres": ["drama", "fantasy", "horror"],
+            "is_anime": False,
+        }
+    )
+
+
+def _traced_bytes(build) -> int:
+    """Bytes still allocated by `build()` while its result is alive."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return allocated
+
+
+def episode_bytes(episodes: int = EPISODES) -> float:
+    """Bytes allocated per episode for a show of `episodes` episodes built
+    from decoded JSON payloads, the way the indexer builds them."""
+    payloads = [episode_payload(number) for number in range(1, EPISODES_PER_SEASON + 1)]
+
+    def build():
+        show = Show(json.loads('{"imdb_id": "tt1405406", "title": "The Vampire Diaries"}'))
+        for season_number in range(1, episodes // EPISODES_PER_SEASON + 1):
+            season = Season({"number": season_number})
+            for payload in payloads:
+                season.add_episode(Episode(json.loads(payload)))
+            show.add_season(season)
+        return show
+
+    return _traced_bytes(build) / episodes
+
+
+def payload_bytes(episodes: int = EPISODES) -> float:
+    """Bytes allocated per decoded episode payload, kept alive."""
+    payloads = [episode_payload(number) for number in range(1, EPISODES_PER_SEASON + 1)]
+    return _traced_bytes(
+        lambda: [json.loads(payloads[number % EPISODES_PER_SEASON]) for number in range(episodes)]
+    ) / episodes
+
+
+if __name__ == "__main__":
+    sys.stdout.write(
+        f"{episode_bytes():.0f} bytes per episode, "
+        f"{payload_bytes():.0f} bytes per decoded payload\n"
+    )
@@ -0,0 +1,92 @@
+"""Time to save and fully load a library of 50k items
+
+Run `PYTHONPATH=. python benchmarks/snapshot_load.py` from the backend
+directory. It times `MediaItemContainer.save` and a full `load`, indexes
+included, of a library of 50 shows with 1000 episodes each and 3 streams
+per episode, and loads a dill pickle of the same container for comparison.
+It only uses the public container API, so on older trees it times the dill
+snapshots those write.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import dill
+from program.media.container import MediaItemContainer
+from program.media.item import Episode, Season, Show
+from RTN import Torrent, parse
+
+SHOWS = 50
+SEASONS = 10
+EPISODES = 100
+STREAMS = 3
+# loads are timed as the best of this many runs
+REPEAT = 3
+
+
+def build_library() -> MediaItemContainer:
+    titles = [
+        f"Show.S01E01.{resolution}.WEB-DL.x264-GRP"
+        for resolution in ("2160p", "1080p", "720p", "480p")[:STREAMS]
+    ]
+    parsed = [parse(title) for title in titles]
+    container = MediaItemContainer()
+    for show_number in range(SHOWS):
+        show = Show({"imdb_id": f"tt{show_number:07}", "title": f"Show {show_number}"})
+        for season_number in range(1, SEASONS + 1):
+            season = Season({"number": season_number, "title": f"Season {season_number}"})
+            for episode_number in range(1, EPISODES + 1):
+                episode = Episode({"number": episode_number, "title": f"Episode {episode_number}"})
+                streams = {}
+                for stream, (title, data) in enumerate(zip(titles, parsed)):
+                    infohash = f"{show_number:08}{season_number:04}{episode_number:04}{stream:024}"
+                    streams[infohash] = Torrent(
+                        raw_title=title, infohash=infohash, data=data, rank=100 - stream, lev_ratio=1
+                    )
+                # stored the way the scrapers store them, older trees keep the models
+                if hasattr(episode, "add_streams"):
+                    episode.add_streams(streams)
+                else:
+                    episode.streams.update(streams)
+                season.add_episode(episode)
+            show.add_season(season)
+        container.upsert(show)
+    return container
+
+
+def _timed(fn, repeat: int = 1) -> float:
+    """Best time of `repeat` runs of fn."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    container = build_library()
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = os.path.join(directory, "media.pkl")
+        legacy = os.path.join(directory, "legacy.pkl")
+        saved = _timed(lambda: container.save(snapshot))
+        with open(legacy, "wb") as file:
+            dill.dump(container, file)
+        load = _timed(lambda: MediaItemContainer().load(snapshot), REPEAT)
+        dill_load = _timed(lambda: MediaItemContainer().load(legacy), REPEAT)
+        loaded = MediaItemContainer()
+        loaded.load(snapshot)
+        report = (
+            f"{len(loaded)} items\n"
+            f"save: {saved:.2f}s, {os.path.getsize(snapshot) / 2**20:.1f}MB\n"
+            f"load: {load:.2f}s\n"
+            f"dill load: {dill_load:.2f}s, {os.path.getsize(legacy) / 2**20:.1f}MB\n"
+            f"speedup: {dill_load / load:.1f}x\n"
+        )
+        sys.stdout.write(report)
+
+
+if __name__ == "__main__":
+    main()
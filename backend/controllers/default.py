@@ -24,6 +24,28 @@ async def health(request: Request):
     }
 
 
+@router.get("/queue")
+async def get_queue(request: Request):
+    event_queue = getattr(request.app.program, "event_queue", None)
+    if event_queue is None:
+        return {"success": True, "data": {}}
+    return {
+        "success": True,
+        "data": event_queue.stats(),
+    }
+
+
+@router.get("/workers")
+async def get_workers(request: Request):
+    executors = getattr(request.app.program, "executors", {})
+    return {
+        "success": True,
+        "data": {
+            service.__name__: executor.stats() for service, executor in executors.items()
+        },
+    }
+
+
 @router.get("/user")
 async def get_rd_user():
     api_key = settings_manager.settings.real_debrid.api_key
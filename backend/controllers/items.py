@@ -16,8 +16,33 @@ async def get_states():
     }
 
 
+@router.get("/changes")
+def get_changes(request: Request, since: int = 0):
+    media_items = request.app.program.media_items
+    # read the generation first, changes made meanwhile are returned again
+    generation = media_items.generation
+    changes = media_items.changes_since(since)
+    if changes is None:
+        raise HTTPException(
+            status_code=410, detail="Changes are no longer available, reload the items"
+        )
+    return {
+        "success": True,
+        "generation": generation,
+        "changes": [
+            {
+                "generation": change.generation,
+                "item_id": str(change.item_id),
+                "old_state": change.old_state,
+                "new_state": change.new_state,
+            }
+            for change in changes
+        ],
+    }
+
+
 @router.get("/")
-async def get_items(request: Request):
+def get_items(request: Request):
     return {
         "success": True,
         "items": [item.to_dict() for item in request.app.program.media_items],
@@ -25,7 +50,7 @@ async def get_items(request: Request):
 
 
 @router.get("/extended/{item_id}")
-async def get_extended_item_info(request: Request, item_id: str):
+def get_extended_item_info(request: Request, item_id: str):
     item = request.app.program.media_items.get_item_by_id(item_id)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -36,7 +61,7 @@ async def get_extended_item_info(request: Request, item_id: str):
 
 
 @router.delete("/remove/{item}")
-async def remove_item(request: Request, item: str):
+def remove_item(request: Request, item: str):
     request.app.program.media_items.remove(item)
     request.app.program.content.overseerr.delete_request(item)
     return {
@@ -46,7 +71,7 @@ async def remove_item(request: Request, item: str):
 
 
 @router.get("/imdb/{imdb_id}")
-async def get_imdb_info(request: Request, imdb_id: str):
+def get_imdb_info(request: Request, imdb_id: str):
     item = request.app.program.media_items.get_item_by_imdb_id(imdb_id)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import contextlib
 import sys
 import threading
@@ -49,7 +50,14 @@ class Server(uvicorn.Server):
             sys.exit(0)
 
 
-app = FastAPI()
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # services of the asyncio engine share the server's event loop
+    app.program.loop = asyncio.get_running_loop()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 app.program = Program(args)
 
 app.add_middleware(
@@ -0,0 +1,155 @@
+"""Priority queue of the events the Program processes"""
+
+import heapq
+import time
+from collections import Counter
+from enum import IntEnum
+from itertools import count
+from queue import Full, PriorityQueue
+
+from program.media.item import MediaItem
+from program.settings.manager import settings_manager
+from program.types import Event, Service
+
+
+class Priority(IntEnum):
+    """Priority classes of events, lower values are processed first."""
+
+    REQUEST = 0
+    CONTENT = 1
+    PROGRESS = 2
+    RETRY = 3
+
+
+class EventQueue(PriorityQueue):
+    """Queue that hands out events by priority class, and in the order they
+    were put within a class.
+
+    The class of an event is the one configured for the service that emitted
+    it in `pipeline.priorities`. An item keeps the class of the service that
+    requested it while it moves through the pipeline, so a user's request
+    isn't queued up behind a large list import. Retries keep their own class.
+
+    An item event replaces a queued event of the same service for the same
+    item, the newer item supersedes the older one, and it keeps its place in
+    the queue, moved up to the newer event's class if that is the higher
+    one. Patches are never coalesced, each of them changes the item.
+
+    `maxsize` and `retry_limit` bound the queue for the services that feed
+    the pipeline. Their events wait while `maxsize` events are queued, and
+    retries are shed once `retry_limit` events are queued, the Program puts
+    them again later. Events of the services in the pipeline are always
+    queued: their jobs are bounded by the executors already, and the Program
+    must not wait for itself.
+    """
+
+    def __init__(self, maxsize=0, retry_limit: int | None = None):
+        super().__init__(maxsize)
+        self.retry_limit = retry_limit
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self._sequence = count()
+        self._depths: Counter[Priority] = Counter()
+        self._queued: dict[tuple, list] = {}
+        self.coalesced = 0
+        self.shed = 0
+        self.high_water = 0
+
+    def put(self, event: Event, block=True, timeout=None, requested_by=None) -> bool:
+        """Put an event, `requested_by` defaults to the requester of its item.
+        Returns False if the event was a retry and has been shed."""
+        if requested_by is None and event.item is not None:
+            requested_by = requester_of(event.item)
+        source = priority = priority_of(event.emitted_by)
+        if priority is not Priority.RETRY and requested_by is not None:
+            priority = min(priority, priority_of(requested_by))
+        with self.not_full:
+            if source is Priority.RETRY and self._over(self.retry_limit):
+                self.shed += 1
+                return False
+            if source is not Priority.PROGRESS:
+                self._wait_for_room(block, timeout)
+            if self._put([priority, next(self._sequence), event]):
+                self.high_water = max(self.high_water, self._qsize())
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+        return True
+
+    def _over(self, limit: int | None) -> bool:
+        return bool(limit) and self._qsize() >= limit
+
+    def _wait_for_room(self, block: bool, timeout: float | None):
+        # the wait of `Queue.put`
+        if not block:
+            if self._over(self.maxsize):
+                raise Full
+        elif timeout is None:
+            while self._over(self.maxsize):
+                self.not_full.wait()
+        else:
+            deadline = time.monotonic() + timeout
+            while self._over(self.maxsize):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    raise Full
+                self.not_full.wait(remaining)
+
+    def _put(self, entry: list) -> bool:
+        """Queue an entry, False if it was coalesced with a queued one."""
+        key = _coalescing_key(entry[2])
+        if key is not None:
+            if (queued := self._queued.get(key)) is not None:
+                queued[2] = entry[2]
+                if entry[0] < queued[0]:
+                    self._depths[queued[0]] -= 1
+                    self._depths[entry[0]] += 1
+                    queued[0] = entry[0]
+                    heapq.heapify(self.queue)
+                self.coalesced += 1
+                return False
+            self._queued[key] = entry
+        self._depths[entry[0]] += 1
+        super()._put(entry)
+        return True
+
+    def _get(self) -> Event:
+        priority, _, event = super()._get()
+        self._depths[priority] -= 1
+        if (key := _coalescing_key(event)) is not None:
+            del self._queued[key]
+        return event
+
+    def depths(self) -> dict[str, int]:
+        """Number of queued events per priority class."""
+        with self.mutex:
+            return {priority.name.lower(): self._depths[priority] for priority in Priority}
+
+    def stats(self) -> dict[str, int]:
+        """Queue depths along with the counters of the queue."""
+        return {
+            **self.depths(),
+            "coalesced": self.coalesced,
+            "shed": self.shed,
+            "high_water": self.high_water,
+        }
+
+
+def _coalescing_key(event: Event) -> tuple | None:
+    if event.patch is not None:
+        return None
+    return event.emitted_by, event.item.item_id
+
+
+def requester_of(item: MediaItem) -> Service | None:
+    """The service that requested an item, seasons and episodes are requested
+    along with their show."""
+    while item.requested_by is None and item.parent is not None:
+        item = item.parent
+    return item.requested_by
+
+
+def priority_of(service: Service) -> Priority:
+    name = getattr(service, "__name__", service.__class__.__name__)
+    priority = settings_manager.settings.pipeline.priorities.get(name, "progress")
+    return Priority[priority.upper()]
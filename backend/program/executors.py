@@ -0,0 +1,288 @@
+"""Thread pools and event loop the Program runs its services in"""
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from typing import Callable
+
+from program.settings.manager import settings_manager
+from program.types import Service
+from utils.logger import logger
+from utils.request import httpx
+
+DEFAULT_WORKERS = 1
+
+
+class ServiceExecutor(ThreadPoolExecutor):
+    """Thread pool of a single service, so a slow service only ever occupies
+    its own workers.
+
+    Services are generators, a job runs the service to completion in the pool
+    and its future holds the list of emitted items. With `max_queued` set,
+    jobs submitted while that many jobs are waiting for a worker are deferred
+    by the pool, see `_Stage`. The pool counts its queued, running and
+    deferred jobs for `stats`, `room` tells how many more it takes."""
+
+    # the service method jobs run
+    method = "run"
+
+    def __init__(self, service: Service, max_workers: int, max_queued: int | None = None):
+        super().__init__(max_workers=max_workers, thread_name_prefix=service.__name__)
+        self.max_workers = max_workers
+        self._stage = _Stage(max_workers, max_queued)
+        self._stats_lock = threading.Lock()
+        self._submitted = 0
+        self._running = 0
+        self._high_water = 0
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        if self._shutdown:
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        future = self._stage.submit(lambda: self._start(fn, *args, **kwargs))
+        with self._stats_lock:
+            # jobs that have to wait for a worker
+            waiting = self._submitted + self._stage.deferred - self.max_workers
+            self._high_water = max(self._high_water, waiting)
+        return future
+
+    def room(self) -> int | None:
+        """Jobs the pool takes before submitting waits, None if unbounded."""
+        return self._stage.room
+
+    def _start(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._stats_lock:
+            self._submitted += 1
+        try:
+            return super().submit(self._run, fn, *args, **kwargs)
+        except RuntimeError:
+            with self._stats_lock:
+                self._submitted -= 1
+            raise
+
+    def _run(self, fn: Callable, *args, **kwargs) -> list:
+        with self._stats_lock:
+            self._running += 1
+        try:
+            return list(fn(*args, **kwargs) or ())
+        finally:
+            with self._stats_lock:
+                self._running -= 1
+                self._submitted -= 1
+            self._stage.done()
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queued": self._submitted - self._running,
+                "deferred": self._stage.deferred,
+                "high_water": self._high_water,
+            }
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self._stage.cancel()
+        super().shutdown(wait, cancel_futures=cancel_futures)
+
+
+class CoroutineExecutor:
+    """Runs the `arun` async generators of a service on an event loop owned
+    by another thread, at most `limit` of them at once.
+
+    It is submitted to like a `ServiceExecutor` and its futures hold the list
+    of emitted items as well, so the Program handles both the same way."""
+
+    method = "arun"
+
+    def __init__(
+        self,
+        service: Service,
+        loop: asyncio.AbstractEventLoop,
+        limit: int,
+        max_queued: int | None = None,
+    ):
+        self.service = service
+        self.loop = loop
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self._stage = _Stage(limit, max_queued)
+        self._stats_lock = threading.Lock()
+        self._futures: set[Future] = set()
+        self._running = 0
+        self._high_water = 0
+        self._shutdown = False
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        if self._shutdown:
+            raise RuntimeError("cannot schedule new coroutines after shutdown")
+        future = self._stage.submit(lambda: self._start(fn, *args, **kwargs))
+        with self._stats_lock:
+            waiting = len(self._futures) + self._stage.deferred - self.limit
+            self._high_water = max(self._high_water, waiting)
+        return future
+
+    def room(self) -> int | None:
+        """Coroutines the executor takes before submitting waits, None if unbounded."""
+        return self._stage.room
+
+    def _start(self, fn: Callable, *args, **kwargs) -> Future:
+        future = asyncio.run_coroutine_threadsafe(self._run(fn, *args, **kwargs), self.loop)
+        with self._stats_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    async def _run(self, fn: Callable, *args, **kwargs) -> list:
+        async with self._semaphore:
+            with self._stats_lock:
+                self._running += 1
+            try:
+                return [item async for item in fn(*args, **kwargs)]
+            finally:
+                with self._stats_lock:
+                    self._running -= 1
+
+    def _discard(self, future: Future):
+        with self._stats_lock:
+            self._futures.discard(future)
+        self._stage.done()
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return {
+                "workers": self.limit,
+                "running": self._running,
+                "queued": len(self._futures) - self._running,
+                "deferred": self._stage.deferred,
+                "high_water": self._high_water,
+            }
+
+    def shutdown(self, wait=True):
+        self._shutdown = True
+        self._stage.cancel()
+        with self._stats_lock:
+            futures = set(self._futures)
+        if wait:
+            wait_futures(futures)
+        else:
+            for future in futures:
+                future.cancel()
+
+
+class _Stage:
+    """The jobs an executor takes at once, running or queued: `workers` plus
+    `max_queued`, or any number without `max_queued`.
+
+    A job submitted while the stage is full is deferred, its future is
+    returned right away and the job is started once a job of the stage
+    finishes. A full stage so only holds up its own jobs, never the thread
+    that submits to all of the stages, until it has deferred as many jobs as
+    it takes. Submitting waits for a deferred job to start from then on, the
+    Program checks `room` to stop taking events before that happens."""
+
+    def __init__(self, workers: int, max_queued: int | None):
+        self.limit = None if max_queued is None else workers + max_queued
+        self._lock = threading.Lock()
+        # notified when a deferred job is started or cancelled
+        self._started = threading.Condition(self._lock)
+        self._taken = 0
+        self._deferred: deque[tuple[Future, Callable[[], Future]]] = deque()
+        self._cancelled = False
+
+    @property
+    def deferred(self) -> int:
+        return len(self._deferred)
+
+    @property
+    def room(self) -> int | None:
+        """Jobs the stage takes, started or deferred, before submitting waits."""
+        if self.limit is None:
+            return None
+        with self._lock:
+            return 2 * self.limit - self._taken - len(self._deferred)
+
+    def submit(self, start: Callable[[], Future]) -> Future:
+        """Start a job with `start` if the stage has room, defer it otherwise."""
+        with self._lock:
+            while self.limit is not None and self._taken >= self.limit:
+                if self._cancelled:
+                    future = Future()
+                    future.cancel()
+                    return future
+                if len(self._deferred) < self.limit:
+                    future = Future()
+                    self._deferred.append((future, start))
+                    return future
+                self._started.wait()
+            self._taken += 1
+        try:
+            return start()
+        except RuntimeError:
+            self.done()
+            raise
+
+    def done(self) -> None:
+        """Hand the place of a finished job to the oldest deferred job."""
+        while True:
+            with self._lock:
+                if not self._deferred:
+                    self._taken -= 1
+                    return
+                future, start = self._deferred.popleft()
+                self._started.notify()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                start().add_done_callback(lambda started, future=future: _copy(started, future))
+                return
+            except RuntimeError as error:
+                # the executor was shut down meanwhile
+                future.set_exception(error)
+
+    def cancel(self) -> None:
+        """Cancel the deferred jobs, and the jobs still waiting to be deferred."""
+        with self._lock:
+            deferred, self._deferred = self._deferred, deque()
+            self._cancelled = True
+            self._started.notify_all()
+        for future, _ in deferred:
+            future.cancel()
+
+
+def _copy(source: Future, target: Future) -> None:
+    """Complete `target` with the outcome of `source`."""
+    if source.cancelled():
+        target.set_exception(CancelledError())
+    elif (error := source.exception()) is not None:
+        target.set_exception(error)
+    else:
+        target.set_result(source.result())
+
+
+def create_executors(
+    services, loop: asyncio.AbstractEventLoop | None = None
+) -> dict[Service, ServiceExecutor | CoroutineExecutor]:
+    """Create a pool for each service, sized by `pipeline.workers`.
+
+    With the asyncio engine, services that have an `arun` run on `loop`
+    instead, `pipeline.async_concurrency` of them at once. Either way up to
+    `pipeline.stage_queue_size` jobs wait, further jobs are deferred, see
+    `_Stage`."""
+    pipeline = settings_manager.settings.pipeline
+    if pipeline.engine == "asyncio" and (loop is None or httpx is None):
+        logger.error("The asyncio engine needs httpx and a running event loop, using threads")
+        loop = None
+    executors = {}
+    for service in services:
+        if pipeline.engine == "asyncio" and loop is not None and hasattr(service, "arun"):
+            executors[service] = CoroutineExecutor(
+                service, loop, pipeline.async_concurrency, pipeline.stage_queue_size
+            )
+        else:
+            workers = pipeline.workers.get(service.__name__, DEFAULT_WORKERS)
+            executors[service] = ServiceExecutor(
+                service, workers, pipeline.stage_queue_size
+            )
+    return executors
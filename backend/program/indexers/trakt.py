@@ -28,6 +28,7 @@ class TraktIndexer:
                 "Item %s does not have an imdb_id, cannot index it", item.log_string
             )
             return None
+        requested_by = item.requested_by
         item = create_item_from_imdb_id(imdb_id)
         if not item:
             logger.error("Failed to get item from imdb_id: %s", imdb_id)
@@ -43,6 +44,8 @@ class TraktIndexer:
                     season_item.add_episode(episode_item)
                 item.add_season(season_item)
         item.indexed_at = datetime.now()
+        # the indexed item replaces the requested one, keep who requested it
+        item.requested_by = requested_by
         yield item
 
     @staticmethod
@@ -99,13 +99,11 @@ class PlexLibrary:
                 continue
             if not (season_item := _map_item_from_data(season)):
                 continue
-            episode_items = []
             for episode in season.episodes():
                 episode_item = _map_item_from_data(episode)
                 if episode_item:
-                    episode_items.append(episode_item)
-            season_item.episodes = episode_items
-            item.seasons.append(season_item)
+                    season_item.add_episode(episode_item)
+            item.add_season(season_item)
         return item
 
     def _is_wanted_section(self, section):
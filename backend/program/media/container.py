@@ -1,156 +1,675 @@
+import gc
 import os
-from copy import copy, deepcopy
+from bisect import bisect_right
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from copy import copy
+from datetime import datetime
+from gzip import BadGzipFile
+from operator import attrgetter
 from pickle import UnpicklingError
-from typing import Generator
+from typing import Any, Generator, Iterable, NamedTuple
 
 import dill
 from program.media.item import Episode, ItemId, MediaItem, Movie, Season, Show
+from program.media.patch import ItemPatch
+from program.media.snapshot import (
+    GZIP_MAGIC,
+    UnsupportedSnapshotError,
+    read_snapshot,
+    write_snapshot,
+)
 from program.media.state import States
 from utils.logger import logger
+from utils.rwlock import ReadWriteLock
+
+EXTERNAL_IDS = ("imdb_id", "tvdb_id", "tmdb_id")
+
+CHANGE_LOG_SIZE = 10_000
+
+
+class _IndexEntry(NamedTuple):
+    """Indexed values of an item, used to remove it from the indexes again"""
+
+    state: States
+    imdb_id: str | None
+    tvdb_id: Any
+    tmdb_id: Any
+    requested_by: Any
+
+
+class Change(NamedTuple):
+    """An item stored or removed at a generation of the container"""
+
+    generation: int
+    item_id: ItemId
+    old_state: States | None
+    new_state: States | None
+
+
+class ColdItem(NamedTuple):
+    """Summary of a completed movie or show that was moved to the cold store.
+
+    It holds what the indexes, the item listing and the checks of incoming
+    requests need, the item itself is loaded from the cold store again when
+    it is used. The summaries of its seasons and episodes are its children."""
+
+    item_id: ItemId
+    state: States
+    indexed_at: datetime | None
+    imdb_id: str | None
+    tvdb_id: Any
+    tmdb_id: Any
+    requested_by: Any
+    key: str | None
+    folder: str | None
+    file: str | None
+    summary: dict[str, Any]
+    # summaries written before they held their children have none
+    children: tuple["ColdItem", ...] = ()
+
+    @classmethod
+    def of(cls, item: MediaItem) -> "ColdItem":
+        return cls(
+            item_id=item.item_id,
+            state=item.state,
+            indexed_at=item.indexed_at,
+            imdb_id=item.imdb_id,
+            tvdb_id=item.tvdb_id,
+            tmdb_id=item.tmdb_id,
+            requested_by=item.requested_by,
+            key=item.key,
+            folder=item.folder,
+            file=item.file,
+            summary=item.to_dict(),
+            children=tuple(
+                cls.of(child)
+                for child in getattr(item, "seasons", None) or getattr(item, "episodes", ())
+            ),
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(self.summary)
+
+    def walk(self) -> Generator["ColdItem", None, None]:
+        """Yield the summary and the summaries of all of its children"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
 
 
 class MediaItemContainer:
-    """MediaItemContainer class"""
+    """MediaItemContainer class
+
+    Items handed out by the container are shared, read-only snapshots of its
+    state. Call `item.copy()` before modifying one; `upsert` stores a copy of
+    its input, so the container's items are never modified by the pipeline.
+
+    Changes hold the write lock, readers that look at more than one item hold
+    the read lock. Iterating over the container iterates over a snapshot of
+    it, so readers on other threads see a consistent view and don't hold up
+    the pipeline while they work through it.
 
-    def __init__(self):
+    With a cold store attached, `evict_completed` moves completed movies and
+    shows out of memory. Only a `ColdItem` summary of them stays resident,
+    they are loaded again as soon as they or one of their children is looked
+    up with `get`. Iterating, `peek`, `in` and the state queries answer from
+    the summaries as they are, the seasons and episodes of a cold show have
+    summaries of their own, so they are listed and counted as before.
+    """
+
+    def __init__(self, change_log_size: int = CHANGE_LOG_SIZE):
         self._items = {}
         self._shows = {}
         self._seasons = {}
         self._episodes = {}
         self._movies = {}
+        self._reset_indexes()
+        # bumped on every change, tells persistence whether anything changed
+        self.generation = 0
+        # the most recent changes, and the newest generation dropped from them
+        self._changes: deque[Change] = deque(maxlen=change_log_size)
+        self._dropped_generation = 0
+        self.store = None
+        # ids of the items changed in a batch, written to the store at its end
+        self._pending_writes: dict[ItemId, None] | None = None
+        self.lock = ReadWriteLock()
+        self._cold: dict[ItemId, ColdItem] = {}
+        self.cold_store = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # stores hold open connections or files, they are attached at runtime
+        state["store"] = None
+        state["cold_store"] = None
+        state["_pending_writes"] = None
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = ReadWriteLock()
+
+    def _reset_indexes(self) -> None:
+        """Secondary indexes, kept up to date by `upsert` and `remove`"""
+        self._indexed: dict[ItemId, _IndexEntry] = {}
+        self._state_index: dict[States, set[ItemId]] = defaultdict(set)
+        self._requested_by_index: dict[Any, set[ItemId]] = defaultdict(set)
+        self._external_id_index: dict[str, dict[Any, set[ItemId]]] = {
+            attr: defaultdict(set) for attr in EXTERNAL_IDS
+        }
 
-    def __iter__(self) -> Generator[MediaItem, None, None]:
-        for item in self._items.values():
-            yield item
+    def __iter__(self) -> Generator[MediaItem | ColdItem, None, None]:
+        with self.lock.read():
+            items = [*self._items.values(), *self._cold.values()]
+        yield from items
 
     def __contains__(self, item) -> bool:
-        return item in self._items
+        return self.peek(item) is not None
 
     def __len__(self) -> int:
         """Get length of container"""
-        return len(self._items)
+        return len(self._items) + len(self._cold)
 
     def __getitem__(self, item_id: ItemId) -> MediaItem:
-        return deepcopy(self._items[item_id])
+        if (item := self.get(item_id)) is None:
+            raise KeyError(item_id)
+        return item
 
     def get(self, key, default=None) -> MediaItem:
-        return deepcopy(self._items.get(key, default))
+        item = self._items.get(key)
+        if item is None and self._cold:
+            item = self._load_cold(key)
+        return default if item is None else item
+
+    def peek(self, key, default=None) -> MediaItem | ColdItem:
+        """Get an item like `get`, but get the summary of a cold item instead
+        of loading it."""
+        item = self._items.get(key)
+        if item is None:
+            item = self._cold.get(key)
+        if item is None and self._cold:
+            item = self._load_cold(key)
+        return default if item is None else item
+
+    def _load_cold(self, item_id: ItemId) -> MediaItem | None:
+        """Load the cold item an item belongs to back into memory."""
+        collection = getattr(item_id, "collection", None)
+        if collection not in self._cold:
+            return None
+        with self.lock.write():
+            if collection in self._cold:
+                item = self.cold_store.get(collection)
+                for summary in self._cold[collection].walk():
+                    self._drop_cold(summary.item_id)
+                    self._unindex(summary.item_id)
+                if item is None:
+                    logger.error("Cold item %s is missing from the cold store", item_id)
+                else:
+                    self._store_tree(item, record_change=False)
+            return self._items.get(item_id)
 
     @property
     def seasons(self) -> dict[ItemId, Season]:
-        return deepcopy(self._seasons)
+        with self.lock.read():
+            return copy(self._seasons)
 
     @property
     def episodes(self) -> dict[ItemId, Episode]:
-        return deepcopy(self._episodes)
+        with self.lock.read():
+            return copy(self._episodes)
 
     @property
     def shows(self) -> dict[ItemId, Show]:
-        return deepcopy(self._shows)
+        with self.lock.read():
+            return copy(self._shows)
 
     @property
     def movies(self) -> dict[ItemId, Movie]:
-        return deepcopy(self._movies)
+        with self.lock.read():
+            return copy(self._movies)
 
     def upsert(self, item: MediaItem) -> None:
         """Iterate through the input item and upsert all parents and children."""
-        # Use deepcopy so that further modifications made to the input item
-        # will not affect the container state
-        item = deepcopy(item)
-        self._items[item.item_id] = item
-        detatched = item.item_id.parent_id is None or item.parent is None
+        # seasons and episodes are linked to the container's own parent by id,
+        # the parent they carry (if any) is not used. It is loaded if it's cold.
+        detatched = self.get(item.item_id.parent_id) is None
         if isinstance(item, (Season, Episode)) and detatched:
             logger.error(
                 "%s item %s is detatched and not associated with a parent, and thus"
                 + " it cannot be upserted into the database",
-                item.__class__.name,
+                item.__class__.__name__,
                 item.log_string,
             )
             raise ValueError("Item detached from parent")
-        if isinstance(item, Show):
-            self._shows[item.item_id] = item
-            for season in item.seasons:
-                season.parent = item
-                self._items[season.item_id] = season
-                self._seasons[season.item_id] = season
-                for episode in season.episodes:
-                    episode.parent = season
-                    self._items[episode.item_id] = episode
-                    self._episodes[episode.item_id] = episode
+        # Copy the item and its children so that further modifications made to
+        # the input item will not affect the container state. Parents are not
+        # copied, the stored item is linked to the container's own parent below.
+        item = item.copy()
+        with self.lock.write():
+            self._replace(item)
+
+    def upsert_many(self, items: Iterable[MediaItem]) -> None:
+        """Upsert several items, and write them to the store together."""
+        with self.batch():
+            for item in items:
+                self.upsert(item)
+
+    @contextmanager
+    def batch(self):
+        """Defer writing changes to the store until the end of the block.
+
+        The container itself is updated right away. At the end of the block
+        the changed items are written together, an item whose parent changed
+        as well is written as part of the parent, and several changed
+        children of one parent are written as the parent. The write lock is
+        held for the whole block, readers see none or all of its changes."""
+        with self.lock.write():
+            if self._pending_writes is not None:
+                # nested in another batch, which writes the changes
+                yield
+                return
+            self._pending_writes = {}
+            try:
+                yield
+            finally:
+                pending_writes, self._pending_writes = self._pending_writes, None
+                if self.store and pending_writes:
+                    self.store.upsert_many(self._coalesce_writes(pending_writes))
+
+    def _coalesce_writes(self, item_ids: Iterable[ItemId]) -> list[MediaItem]:
+        item_ids = {item_id for item_id in item_ids if item_id in self._items}
+        siblings = Counter(item_id.parent_id for item_id in item_ids)
+        item_ids.update(
+            parent_id
+            for parent_id, count in siblings.items()
+            if parent_id is not None and count > 1
+        )
+        writes = [
+            item_id
+            for item_id in item_ids
+            if not any(parent_id in item_ids for parent_id in item_id.ancestors())
+        ]
+        # parents are written before their children
+        writes.sort(key=lambda item_id: len(list(item_id.ancestors())))
+        return [self._items[item_id] for item_id in writes]
+
+    def apply(self, patch: ItemPatch) -> MediaItem | None:
+        """Apply a patch emitted by a service to a copy of the stored item, and
+        store the patched copy. Returns the patched item."""
+        with self.lock.write():
+            if (item := self.get(patch.item_id)) is None:
+                logger.error("Cannot apply %s, item is not stored", patch.log_string)
+                return None
+            item = item.copy()
+            patch.apply(item)
+            self._replace(item)
+        return item
+
+    def _replace(self, item: MediaItem) -> None:
+        """Store an item the container owns in place of the stored one."""
+        self.generation += 1
+        self._store_tree(item)
+        # the stored parents are snapshots readers may hold, copies of them
+        # hold the item instead
         if isinstance(item, Season):
-            self._seasons[item.item_id] = item
-            # update children
-            for episode in item.episodes:
-                episode.parent = item
-                self._items[episode.item_id] = episode
-                self._episodes[episode.item_id] = episode
-            # Ensure the parent Show is updated in the container
-            container_show: Show = self._items[item.item_id.parent_id]
-            parent_index = container_show.get_season_index_by_id(item.item_id)
-            if parent_index is not None:
-                container_show.seasons[parent_index] = item
+            show = _copy_parent(self._items[item.item_id.parent_id])
+            show.add_season(item)
+            self._store_parents(show)
         elif isinstance(item, Episode):
-            self._episodes[item.item_id] = item
-            # Ensure the parent Season is updated in the container
-            container_season: Season = self._items[item.item_id.parent_id]
-            parent_index = container_season.get_episode_index_by_id(item.item_id)
-            if parent_index is not None:
-                container_season.episodes[parent_index] = item
-        elif isinstance(item, Movie):
-            self._movies[item.item_id] = item
-
-    def remove(self, item) -> None:
-        """Remove item from container"""
-        if item.item_id in self._items:
-            del self._items[item.item_id]
+            season = self._items[item.item_id.parent_id]
+            show = _copy_parent(season.parent)
+            season = _copy_parent(season)
+            show.add_season(season)
+            season.add_episode(item)
+            self._store_parents(season, show)
+        if self._pending_writes is not None:
+            self._pending_writes[item.item_id] = None
+        elif self.store:
+            self.store.upsert(item)
+
+    def _store_parents(self, *parents: Show | Season) -> None:
+        """Store copied parents, and point the children they share with the
+        stored parents at them."""
+        for parent in parents:
+            for child in parent.seasons if isinstance(parent, Show) else parent.episodes:
+                object.__setattr__(child, "parent", parent)
+            self._store(parent)
+
+    def _store_tree(self, item: MediaItem, record_change: bool = True) -> None:
+        """Store an item and all of its children."""
+        for child in item.walk():
+            self._store(child, record_change)
+
+    def _store(self, item: MediaItem, record_change: bool = True) -> None:
+        """Store a single item and update its indexes, children are not stored."""
+        self._items[item.item_id] = item
+        if item.item_id in self._cold:
+            self._drop_cold(item.item_id)
+        match item:
+            case Show():
+                self._shows[item.item_id] = item
+            case Season():
+                self._seasons[item.item_id] = item
+            case Episode():
+                self._episodes[item.item_id] = item
+            case Movie():
+                self._movies[item.item_id] = item
+        self._index(item, record_change)
+
+    def _index(self, item: MediaItem | ColdItem, record_change: bool = True) -> None:
+        """Update the secondary indexes of an item to its current values."""
+        if record_change:
+            previous = self._indexed.get(item.item_id)
+            self._record_change(
+                item.item_id, previous.state if previous else None, item.state
+            )
+        self._unindex(item.item_id)
+        entry = _IndexEntry(
+            state=item.state,
+            imdb_id=item.imdb_id,
+            tvdb_id=item.tvdb_id,
+            tmdb_id=item.tmdb_id,
+            requested_by=item.requested_by,
+        )
+        self._indexed[item.item_id] = entry
+        self._state_index[entry.state].add(item.item_id)
+        self._requested_by_index[entry.requested_by].add(item.item_id)
+        for attr in EXTERNAL_IDS:
+            if (value := getattr(entry, attr)) is not None:
+                self._external_id_index[attr][value].add(item.item_id)
+
+    def _unindex(self, item_id: ItemId) -> None:
+        """Remove an item from the secondary indexes."""
+        if (entry := self._indexed.pop(item_id, None)) is None:
+            return
+        _discard(self._state_index, entry.state, item_id)
+        _discard(self._requested_by_index, entry.requested_by, item_id)
+        for attr in EXTERNAL_IDS:
+            if (value := getattr(entry, attr)) is not None:
+                _discard(self._external_id_index[attr], value, item_id)
+
+    def remove(self, item: MediaItem | ItemId | str) -> None:
+        """Remove item and its children from container"""
+        with self.lock.write():
+            item = self.get_item_by_id(getattr(item, "item_id", item))
+            if item is None:
+                return
+            self.generation += 1
+            for child in item.walk():
+                self._record_change(child.item_id, child.state, None)
+                self._items.pop(child.item_id, None)
+                self._shows.pop(child.item_id, None)
+                self._seasons.pop(child.item_id, None)
+                self._episodes.pop(child.item_id, None)
+                self._movies.pop(child.item_id, None)
+                self._unindex(child.item_id)
+            # Detach the item from a copy of its parent, readers may hold the
+            # stored parent
+            if isinstance(item, Season) and item.parent:
+                show = _copy_parent(item.parent)
+                show.seasons = [s for s in show.seasons if s.item_id != item.item_id]
+                self._store_parents(show)
+            elif isinstance(item, Episode) and item.parent:
+                season = _copy_parent(item.parent)
+                show = _copy_parent(season.parent)
+                season.episodes = [
+                    e for e in season.episodes if e.item_id != item.item_id
+                ]
+                show.add_season(season)
+                self._store_parents(season, show)
+            if self.store:
+                # pending writes of the removed items are dropped at the end of
+                # the batch, they are no longer stored
+                self.store.remove(item)
+            if self.cold_store and item.item_id.parent_id is None:
+                self.cold_store.remove(item.item_id)
+
+    def _record_change(self, item_id: ItemId, old_state, new_state) -> None:
+        if len(self._changes) == self._changes.maxlen:
+            self._dropped_generation = self._changes[0].generation
+        self._changes.append(Change(self.generation, item_id, old_state, new_state))
+
+    def changes_since(self, generation: int) -> list[Change] | None:
+        """Get the changes made after the given generation, oldest first.
+
+        Returns None when the change log doesn't reach back that far, the
+        caller has to rescan the container instead."""
+        with self.lock.read():
+            if generation < self._dropped_generation:
+                return None
+            changes = list(self._changes)
+        start = bisect_right(changes, generation, key=attrgetter("generation"))
+        return changes[start:]
+
+    def get_item_by_id(self, item_id: ItemId | str) -> MediaItem | None:
+        """Get an item by its item_id or the string representation of it"""
+        if isinstance(item_id, str):
+            item_id = _parse_item_id(item_id)
+        return self.get(item_id)
+
+    def get_item_by_imdb_id(self, imdb_id: str) -> MediaItem | None:
+        """Get an item by its imdb id, movies and shows take precedence"""
+        return self._get_item_by_external_id("imdb_id", imdb_id)
+
+    def get_item_by_tvdb_id(self, tvdb_id) -> MediaItem | None:
+        """Get an item by its tvdb id, movies and shows take precedence"""
+        return self._get_item_by_external_id("tvdb_id", tvdb_id)
+
+    def get_item_by_tmdb_id(self, tmdb_id) -> MediaItem | None:
+        """Get an item by its tmdb id, movies and shows take precedence"""
+        return self._get_item_by_external_id("tmdb_id", tmdb_id)
+
+    def _get_item_by_external_id(self, attr: str, value) -> MediaItem | None:
+        with self.lock.read():
+            item_ids = self._external_id_index[attr].get(value)
+            if not item_ids:
+                return None
+            item_id = min(item_ids, key=lambda i: i.parent_id is not None)
+        # cold items are loaded outside of the read lock
+        return self.get(item_id)
+
+    def get_items_requested_by(self, service) -> dict[ItemId, MediaItem | ColdItem]:
+        """Get items requested by the given content service"""
+        with self.lock.read():
+            return {
+                item_id: self._resident(item_id)
+                for item_id in self._requested_by_index.get(service, ())
+            }
 
     def count(self, state) -> int:
         """Count items with given state in container"""
-        return len(self.get_items_with_state(state))
+        return len(self._state_index.get(state, ()))
 
-    def get_items_with_state(self, state) -> dict[ItemId, MediaItem]:
+    def get_items_with_state(self, state) -> dict[ItemId, MediaItem | ColdItem]:
         """Get items with the specified state"""
-        return {
-            item_id: self[item_id]
-            for item_id, item in self._items.items()
-            if item.state == state
-        }
+        with self.lock.read():
+            return {
+                item_id: self._resident(item_id)
+                for item_id in self._state_index.get(state, ())
+            }
+
+    def _resident(self, item_id: ItemId) -> MediaItem | ColdItem:
+        """Get the item, or the summary of a cold item, without loading it."""
+        item = self._items.get(item_id)
+        return self._cold[item_id] if item is None else item
 
     def get_incomplete_items(self) -> dict[ItemId, MediaItem]:
-        """Get items with the specified state."""
-        return {
-            # direct self access deep copies the item before passing it
-            item_id: self[item_id]
-            # We need to copy first in case there are additions or deletions while we are iterating
-            for item_id, item in copy(self._items).items()
-            if item.state not in (States.Completed, States.PartiallyCompleted)
-        }
+        """Get items that are not completed or partially completed."""
+        incomplete_items = {}
+        with self.lock.read():
+            for state in States:
+                if state in (States.Completed, States.PartiallyCompleted):
+                    continue
+                incomplete_items.update(self.get_items_with_state(state))
+        return incomplete_items
+
+    def use_store(self, store) -> None:
+        """Load the items persisted in the store, and write every further change
+        through to it."""
+        logger.info("Loading media data from %s", store.filename)
+        with self.lock.write():
+            self.store = None
+            for item in store.load():
+                self.upsert(item)
+            self.store = store
+
+    def use_cold_store(self, cold_store) -> None:
+        """Attach the cold store, the items evicted to it are loaded on demand."""
+        with self.lock.write():
+            self.cold_store = cold_store
+            for summary in cold_store.summaries():
+                if summary.item_id not in self._items:
+                    self._add_cold(summary)
+
+    def evict_completed(self) -> int:
+        """Move completed movies and shows to the cold store, and keep only
+        their summaries in memory. Returns the number of evicted items."""
+        if self.cold_store is None:
+            return 0
+        with self.lock.write():
+            items = [
+                self._items[item_id]
+                for item_id in self._state_index.get(States.Completed, ())
+                if item_id.parent_id is None and item_id in self._items
+            ]
+            if not items:
+                return 0
+            evicted = [(ColdItem.of(item), item) for item in items]
+            self.cold_store.put_many(evicted)
+            for summary, item in evicted:
+                for child in item.walk():
+                    self._items.pop(child.item_id, None)
+                    self._shows.pop(child.item_id, None)
+                    self._seasons.pop(child.item_id, None)
+                    self._episodes.pop(child.item_id, None)
+                    self._movies.pop(child.item_id, None)
+                    self._unindex(child.item_id)
+                    child.item_id.forget_children()
+                self._add_cold(summary)
+            # dicts don't shrink when items are popped, copy them to free the
+            # space of the evicted items
+            self._items = dict(self._items)
+            self._shows = dict(self._shows)
+            self._seasons = dict(self._seasons)
+            self._episodes = dict(self._episodes)
+            self._movies = dict(self._movies)
+            self._indexed = dict(self._indexed)
+            for index in (self._state_index, self._requested_by_index):
+                for key, item_ids in index.items():
+                    index[key] = set(item_ids)
+        logger.debug("Moved %s completed items to the cold store", len(evicted))
+        return len(evicted)
+
+    def _add_cold(self, summary: ColdItem) -> None:
+        for cold in summary.walk():
+            self._cold[cold.item_id] = cold
+            self._index(cold, record_change=False)
+
+    def _reindex_cold(self) -> None:
+        """Index the cold items again after the indexes were reset."""
+        for item_id in [item_id for item_id in self._cold if item_id in self._items]:
+            self._drop_cold(item_id)
+        for summary in self._cold.values():
+            self._index(summary, record_change=False)
+
+    def _drop_cold(self, item_id: ItemId) -> None:
+        """Forget the summary of a cold item, its index entry is left alone."""
+        self._cold.pop(item_id, None)
 
     def save(self, filename) -> None:
         """Save container to file"""
-        with open(filename, "wb") as file:
-            dill.dump(self, file)
+        # Write to a temporary file first so a crash can't leave a torn file behind
+        temporary_filename = f"{filename}.tmp"
+        # parents are updated in place when their children change, hold the
+        # read lock until the items are written
+        with self.lock.read(), open(temporary_filename, "wb") as file:
+            write_snapshot(
+                file,
+                [item for item in self._items.values() if not item.item_id.parent_id],
+            )
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_filename, filename)
 
     def load(self, filename) -> None:
         """Load container from file"""
         logger.info("Loading cached media data from %s", filename)
-        try:
-            with open(filename, "rb") as file:
-                from_disk = dill.load(file)
-                self._items = from_disk._items
-                self._movies = from_disk._movies
-                self._shows = from_disk._shows
-                self._seasons = from_disk._seasons
-                self._episodes = from_disk._episodes
-        except FileNotFoundError:
-            logger.error("Cannot find cached media data at %s", filename)
-        except (EOFError, UnpicklingError):
-            logger.error(
-                "Failed to unpickle media data at %s, wiping cached data", filename
-            )
-            os.remove(filename)
-            self._items = {}
-            self._movies = {}
-            self._shows = {}
-            self._seasons = {}
-            self._episodes = {}
+        # Loading allocates millions of objects that all stay alive, pause the
+        # garbage collector so it doesn't rescan the growing heap over and over
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        with self.lock.write():
+            try:
+                with open(filename, "rb") as file:
+                    if file.read(len(GZIP_MAGIC)) == GZIP_MAGIC:
+                        file.seek(0)
+                        # loading isn't a change, the log starts with the loaded library
+                        for item in read_snapshot(file):
+                            self._store_tree(item, record_change=False)
+                    else:
+                        # snapshots taken before the snapshot format are dill pickles
+                        file.seek(0)
+                        from_disk = dill.load(file)
+                        self._items = from_disk._items
+                        self._movies = from_disk._movies
+                        self._shows = from_disk._shows
+                        self._seasons = from_disk._seasons
+                        self._episodes = from_disk._episodes
+                        self._reset_indexes()
+                        for item in self._items.values():
+                            self._index(item, record_change=False)
+                        self._reindex_cold()
+            except FileNotFoundError:
+                logger.error("Cannot find cached media data at %s", filename)
+            except UnsupportedSnapshotError:
+                # written by another build, it is neither wiped nor overwritten
+                logger.error("Refusing to load media data at %s, keeping the file", filename)
+                raise
+            except (EOFError, UnpicklingError, BadGzipFile):
+                logger.error(
+                    "Failed to unpickle media data at %s, wiping cached data", filename
+                )
+                os.remove(filename)
+                self._items = {}
+                self._movies = {}
+                self._shows = {}
+                self._seasons = {}
+                self._episodes = {}
+                self._reset_indexes()
+                self._reindex_cold()
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+
+
+def _discard(index: dict[Any, set[ItemId]], key, item_id: ItemId) -> None:
+    """Discard an item_id from an index, dropping the key once it is empty"""
+    item_ids = index.get(key)
+    if item_ids is None:
+        return
+    item_ids.discard(item_id)
+    if not item_ids:
+        del index[key]
+
+
+def _copy_parent(parent: Show | Season) -> Show | Season:
+    """Copy a stored show or season to change its children, the children
+    themselves are shared."""
+    clone = copy(parent)
+    # the list is shared by the copy, changing it would change the stored one
+    if isinstance(parent, Show):
+        object.__setattr__(clone, "seasons", list(parent.seasons))
+    else:
+        object.__setattr__(clone, "episodes", list(parent.episodes))
+    return clone
+
+
+
+def _parse_item_id(item_id: str) -> ItemId:
+    """Parse the string representation of an ItemId, e.g. `tt0903747/1/2`"""
+    value, *numbers = item_id.split("/")
+    parsed = ItemId(value)
+    for number in numbers:
+        parsed = ItemId(int(number) if number.isdigit() else number, parsed)
+    return parsed
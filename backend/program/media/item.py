@@ -1,27 +1,162 @@
-from dataclasses import dataclass
+import heapq
+import sys
+from bisect import bisect_left
+from collections import Counter
+from copy import copy, deepcopy
 from datetime import datetime
-from typing import List, Optional, Self
+from functools import cache
+from operator import attrgetter
+from typing import Generator, List, Optional, Self
+from weakref import WeakValueDictionary
 
 from program.media.state import States
+from program.media.stream import Stream, best_streams
 from RTN.parser import extract_episodes
 
+_UNPICKLED = object()
+
 
-@dataclass
 class ItemId:
-    value: str
-    parent_id: Optional[Self] = None
+    """Immutable id of a media item, e.g. `tt0903747/1/2`.
+
+    Ids are interned, creating an id that already exists returns the existing
+    object. Lookups in the container compare by identity and use a hash that
+    is computed once, instead of formatting the whole parent chain."""
+
+    __slots__ = ("value", "parent_id", "_hash", "children", "__weakref__")
+
+    _top_level: WeakValueDictionary = WeakValueDictionary()
+
+    def __new__(cls, value=_UNPICKLED, parent_id: Optional[Self] = None):
+        if value is _UNPICKLED:
+            # ItemId pickled as a dataclass, the state is set in __setstate__
+            return object.__new__(cls)
+        key = str(value)
+        if parent_id is None:
+            interned = cls._top_level
+        elif (interned := parent_id.children) is None:
+            interned = {}
+            object.__setattr__(parent_id, "children", interned)
+        if (item_id := interned.get(key)) is not None:
+            return item_id
+        item_id = object.__new__(cls)
+        _set_item_id(item_id, value, parent_id)
+        return interned.setdefault(key, item_id)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ItemId is immutable")
+
+    def __reduce__(self):
+        return ItemId, (self.value, self.parent_id)
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1] or state[0]
+        _set_item_id(self, state["value"], state.get("parent_id"))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        # ids that were unpickled from old snapshots or created concurrently
+        # are not interned, fall back to comparing values
+        return (
+            isinstance(other, ItemId)
+            and hash(self) == hash(other)
+            and str(self.value) == str(other.value)
+            and self.parent_id == other.parent_id
+        )
+
+    def __hash__(self):
+        return self._hash
+
+    @property
+    def collection(self) -> Self:
+        """The id of the movie or show the item belongs to."""
+        item_id = self
+        while item_id.parent_id is not None:
+            item_id = item_id.parent_id
+        return item_id
+
+    def ancestors(self) -> Generator[Self, None, None]:
+        """Yield the ids of the parent, the grandparent and so on."""
+        item_id = self
+        while (item_id := item_id.parent_id) is not None:
+            yield item_id
+
+    def forget_children(self) -> None:
+        """Stop interning the ids of the children, so they can be freed once the
+        children are evicted. Ids referenced elsewhere stay valid, they compare
+        equal to the ids created later on."""
+        object.__setattr__(self, "children", None)
 
     def __repr__(self):
-        if not self.parent_id:
+        if self.parent_id is None:
             return str(self.value)
         return f"{self.parent_id}/{self.value}"
 
-    def __hash__(self):
-        return hash(self.__repr__())
+
+def _set_item_id(item_id: ItemId, value, parent_id: Optional[ItemId]) -> None:
+    object.__setattr__(item_id, "value", value)
+    object.__setattr__(item_id, "parent_id", parent_id)
+    object.__setattr__(item_id, "_hash", hash((str(value), parent_id)))
+    object.__setattr__(item_id, "children", None)
 
 
 class MediaItem:
-    """MediaItem class"""
+    """MediaItem class
+
+    Items are slotted, a library holds tens of thousands of episodes and a
+    per-instance `__dict__` costs more than the attributes themselves. Strings
+    that repeat across a library (network, country, language, genres) are
+    interned so all items share one copy.
+
+    The state of an item is cached and refreshed whenever an attribute it
+    depends on is assigned. Shows and seasons count the states of their
+    children, a child whose state changes updates its parent's counters, so
+    reading the state of a show doesn't walk all of its episodes.
+
+    Pickled items reference their parent by `item_id.parent_id` only. The
+    parent links its children again when it is unpickled, a season or episode
+    pickled on its own is linked by the container it's upserted into."""
+
+    __slots__ = (
+        "requested_at",
+        "requested_by",
+        "indexed_at",
+        "scraped_at",
+        "scraped_times",
+        "active_stream",
+        "streams",
+        "symlinked",
+        "symlinked_at",
+        "symlinked_times",
+        "file",
+        "folder",
+        "alternative_folder",
+        "is_anime",
+        "parsed_data",
+        "parent",
+        "title",
+        "imdb_id",
+        "item_id",
+        "tvdb_id",
+        "tmdb_id",
+        "network",
+        "country",
+        "language",
+        "aired_at",
+        "genres",
+        "key",
+        "guid",
+        "update_folder",
+        "_status",
+    )
 
     def __init__(self, item):
         self.requested_at = item.get("requested_at", None) or datetime.now()
@@ -47,26 +182,63 @@ class MediaItem:
         # Media related
         self.title = item.get("title", None)
         self.imdb_id = item.get("imdb_id", None)
-        if self.imdb_id:
-            self.imdb_link = f"https://www.imdb.com/title/{self.imdb_id}/"
-            if not hasattr(self, "item_id"):
-                self.item_id = ItemId(self.imdb_id)
+        if self.imdb_id and not hasattr(self, "item_id"):
+            self.item_id = ItemId(self.imdb_id)
         self.tvdb_id = item.get("tvdb_id", None)
         self.tmdb_id = item.get("tmdb_id", None)
-        self.network = item.get("network", None)
-        self.country = item.get("country", None)
-        self.language = item.get("language", None)
+        self.network = _intern(item.get("network", None))
+        self.country = _intern(item.get("country", None))
+        self.language = _intern(item.get("language", None))
         self.aired_at = item.get("aired_at", None)
-        self.genres = item.get("genres", [])
+        self.genres = _intern_genres(item.get("genres", []))
 
         # Plex related
         self.key = item.get("key", None)
         self.guid = item.get("guid", None)
         self.update_folder = item.get("update_folder", None)
 
+        self._index_children()
+        self._status = self._determine_status()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in _STATE_ATTRIBUTES and hasattr(self, "_status"):
+            if name in ("seasons", "episodes"):
+                self._index_children()
+            self._refresh_state()
+
     @property
     def state(self):
-        return self._determine_state()
+        return self._status[0]
+
+    def refresh_state(self):
+        """Reindex the children and refresh the cached state.
+
+        Needed after the children lists were modified in place."""
+        self._index_children()
+        self._refresh_state()
+
+    def _refresh_state(self):
+        previous = self._status
+        self._status = self._determine_status()
+        if previous != self._status and self.parent is not None:
+            self.parent.child_state_changed(self, previous)
+
+    def _determine_status(self):
+        # whether the item has been downloaded is counted by seasons as well
+        return self._determine_state(), bool(self.file and self.folder)
+
+    def _index_children(self):
+        pass
+
+    def child_state_changed(self, child, previous):
+        """Update the counted states after the state of a child changed."""
+
+    @property
+    def imdb_link(self):
+        if self.imdb_id:
+            return f"https://www.imdb.com/title/{self.imdb_id}/"
+        return None
 
     def _determine_state(self):
         if self.key or self.update_folder == "updated":
@@ -88,11 +260,29 @@ class MediaItem:
         self.title = getattr(other, "title", None)
         self.tvdb_id = getattr(other, "tvdb_id", None)
         self.tmdb_id = getattr(other, "tmdb_id", None)
-        self.network = getattr(other, "network", None)
-        self.country = getattr(other, "country", None)
-        self.language = getattr(other, "language", None)
+        self.network = _intern(getattr(other, "network", None))
+        self.country = _intern(getattr(other, "country", None))
+        self.language = _intern(getattr(other, "language", None))
         self.aired_at = getattr(other, "aired_at", None)
-        self.genres = getattr(other, "genres", [])
+        self.genres = _intern_genres(getattr(other, "genres", []))
+
+    def copy(self, parent=None) -> Self:
+        """Copy the item and its children so the copy can be modified freely.
+
+        Parents are shared instead of copied (or replaced by `parent` when given),
+        so copying a single episode doesn't drag the whole show along."""
+        clone = copy(self)
+        if parent is not None:
+            clone.parent = parent
+        clone.streams = copy(self.streams)
+        clone.active_stream = deepcopy(self.active_stream)
+        clone.parsed_data = copy(self.parsed_data)
+        return clone
+
+    def add_streams(self, streams: dict, limit: int | None = None):
+        """Add scraped streams to the item as compact records, best ranked
+        first. With a limit, only that many of the best streams are kept."""
+        self.streams = best_streams({**self.streams, **streams}, limit)
 
     def is_scraped(self):
         return len(self.streams) > 0
@@ -116,7 +306,7 @@ class MediaItem:
             "tvdb_id": self.tvdb_id if hasattr(self, "tvdb_id") else None,
             "tmdb_id": self.tmdb_id if hasattr(self, "tmdb_id") else None,
             "state": self.state.value,
-            "imdb_link": self.imdb_link if hasattr(self, "imdb_link") else None,
+            "imdb_link": self.imdb_link,
             "aired_at": self.aired_at,
             "genres": self.genres if hasattr(self, "genres") else None,
             "guid": self.guid,
@@ -166,8 +356,43 @@ class MediaItem:
         return dict
 
     def __iter__(self):
-        for attr, _ in vars(self).items():
-            yield attr
+        for attr in _slot_names(type(self)):
+            if not attr.startswith("_") and hasattr(self, attr):
+                yield attr
+
+    def __copy__(self):
+        clone = object.__new__(type(self))
+        for attr in _slot_names(type(self)):
+            if (value := getattr(self, attr, _UNSET)) is not _UNSET:
+                if attr in _CHILD_INDEXES:
+                    value = copy(value)
+                object.__setattr__(clone, attr, value)
+        return clone
+
+    def __getstate__(self):
+        return {attr: getattr(self, attr) for attr in self if attr != "parent"}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1]
+        object.__setattr__(self, "parent", None)
+        for attr, value in state.items():
+            try:
+                object.__setattr__(self, attr, value)
+            except AttributeError:
+                # items pickled before they had slots carry attributes that
+                # are derived now, like `imdb_link` and `type`
+                continue
+        streams = state.get("streams")
+        if streams and not isinstance(next(iter(streams.values())), Stream):
+            # streams scraped before they were compacted are RTN models
+            object.__setattr__(self, "streams", best_streams(streams))
+        # children are unpickled before their parents, count them without
+        # notifying the parent that is still being unpickled
+        for child in getattr(self, "seasons", None) or getattr(self, "episodes", ()):
+            object.__setattr__(child, "parent", self)
+        self._index_children()
+        object.__setattr__(self, "_status", self._determine_status())
 
     def __eq__(self, other):
         if isinstance(other, type(self)):
@@ -200,12 +425,20 @@ class MediaItem:
     def collection(self):
         return self.parent.collection if self.parent else self.item_id
 
+    def walk(self) -> Generator["MediaItem", None, None]:
+        """Yield the item and all of its children"""
+        yield self
+        for child in getattr(self, "seasons", None) or getattr(self, "episodes", ()):
+            yield from child.walk()
+
 
 class Movie(MediaItem):
     """Movie class"""
 
+    __slots__ = ()
+    type = "movie"
+
     def __init__(self, item):
-        self.type = "movie"
         self.file = item.get("file", None)
         super().__init__(item)
         self.item_id = ItemId(self.imdb_id)
@@ -217,60 +450,99 @@ class Movie(MediaItem):
 class Show(MediaItem):
     """Show class"""
 
+    __slots__ = ("locations", "seasons", "_seasons_by_number", "_child_states")
+    type = "show"
+
     def __init__(self, item):
         self.locations = item.get("locations", [])
         self.seasons: list[Season] = item.get("seasons", [])
-        self.type = "show"
         super().__init__(item)
         self.item_id = ItemId(self.imdb_id)
 
+    def copy(self, parent=None) -> Self:
+        clone = super().copy(parent)
+        clone.locations = copy(self.locations)
+        clone.seasons = [season.copy(clone) for season in self.seasons]
+        return clone
+
+    def get_season(self, number) -> Optional["Season"]:
+        """Get a season by its number."""
+        return self._seasons_by_number.get(number)
+
     def get_season_index_by_id(self, item_id):
         """Find the index of an season by its item_id."""
-        for i, season in enumerate(self.seasons):
-            if season.item_id == item_id:
-                return i
-        return None
+        if (season := self.get_season(item_id.value)) is None:
+            return None
+        return bisect_left(self.seasons, season.number, key=_number)
+
+    def _index_children(self):
+        self._seasons_by_number = {season.number: season for season in self.seasons}
+        self._child_states = Counter(season.state for season in self.seasons)
+
+    def child_state_changed(self, child, previous):
+        if self._seasons_by_number.get(child.number) is not child:
+            # a copy of the season, the show doesn't hold it
+            return
+        self._child_states[previous[0]] -= 1
+        self._child_states[child.state] += 1
+        self._refresh_state()
 
     def _determine_state(self):
-        if all(season.state == States.Completed for season in self.seasons):
+        states = self._child_states
+        if states[States.Completed] == len(self.seasons):
             return States.Completed
-        if any(
-            season.state in (States.Completed, States.PartiallyCompleted)
-            for season in self.seasons
-        ):
+        if states[States.Completed] or states[States.PartiallyCompleted]:
             return States.PartiallyCompleted
-        if any(season.state == States.Symlinked for season in self.seasons):
-            return States.Symlinked
-        if any(season.state == States.Downloaded for season in self.seasons):
-            return States.Downloaded
-        if any(season.state == States.Scraped for season in self.seasons):
-            return States.Scraped
-        if any(season.state == States.Indexed for season in self.seasons):
-            return States.Indexed
-        if any(season.state == States.Requested for season in self.seasons):
-            return States.Requested
+        for state in (
+            States.Symlinked,
+            States.Downloaded,
+            States.Scraped,
+            States.Indexed,
+            States.Requested,
+        ):
+            if states[state]:
+                return state
         return States.Unknown
 
     def __repr__(self):
         return f"Show:{self.log_string}:{self.state.name}"
 
     def fill_in_missing_children(self, other: Self):
-        existing_seasons = [s.number for s in self.seasons]
-        for s in other.seasons:
-            if s.number not in existing_seasons:
-                self.add_season(s)
+        missing_seasons = []
+        for season in other.seasons:
+            if (existing_season := self.get_season(season.number)) is None:
+                self._adopt(season)
+                missing_seasons.append(season)
             else:
-                existing_season = next(
-                    es for es in self.seasons if s.number == es.number
-                )
-                existing_season.fill_in_missing_children(s)
+                existing_season.fill_in_missing_children(season)
+        if missing_seasons:
+            # both lists are sorted, merge them in one pass
+            self.seasons = list(
+                heapq.merge(self.seasons, missing_seasons, key=_number)
+            )
 
     def add_season(self, season):
-        """Add season to show"""
-        self.seasons.append(season)
+        """Add season to show, replacing the season with the same number"""
+        self._adopt(season)
+        if (existing := self.get_season(season.number)) is not None:
+            index = bisect_left(self.seasons, season.number, key=_number)
+            self.seasons[index] = season
+            self._child_states[existing.state] -= 1
+        elif not self.seasons or self.seasons[-1].number < season.number:
+            self.seasons.append(season)
+        else:
+            self.seasons.insert(
+                bisect_left(self.seasons, season.number, key=_number), season
+            )
+        self._seasons_by_number[season.number] = season
+        self._child_states[season.state] += 1
+        self._refresh_state()
+
+    def _adopt(self, season):
         season.parent = self
-        season.item_id.parent_id = self.item_id
-        self.seasons = sorted(self.seasons, key=lambda s: s.number)
+        season.item_id = ItemId(season.number, self.item_id)
+        for episode in season.episodes:
+            episode.item_id = ItemId(episode.number, season.item_id)
 
     def represent_children(self):
         return [s.represent_children() for s in self.seasons]
@@ -279,35 +551,70 @@ class Show(MediaItem):
 class Season(MediaItem):
     """Season class"""
 
+    __slots__ = (
+        "number",
+        "episodes",
+        "_episodes_by_number",
+        "_child_states",
+        "_downloaded_children",
+    )
+    type = "season"
+
     def __init__(self, item):
-        self.type = "season"
         self.number = item.get("number", None)
         self.episodes: list[Episode] = item.get("episodes", [])
         self.item_id = ItemId(self.number)
         super().__init__(item)
 
+    def copy(self, parent=None) -> Self:
+        clone = super().copy(parent)
+        clone.episodes = [episode.copy(clone) for episode in self.episodes]
+        return clone
+
+    def get_episode(self, number) -> Optional["Episode"]:
+        """Get an episode by its number."""
+        return self._episodes_by_number.get(number)
+
     def get_episode_index_by_id(self, item_id):
         """Find the index of an episode by its item_id."""
-        for i, episode in enumerate(self.episodes):
-            if episode.item_id == item_id:
-                return i
-        return None
+        if (episode := self.get_episode(item_id.value)) is None:
+            return None
+        return bisect_left(self.episodes, episode.number, key=_number)
+
+    def _index_children(self):
+        self._episodes_by_number = {
+            episode.number: episode for episode in self.episodes
+        }
+        self._child_states = Counter(episode.state for episode in self.episodes)
+        self._downloaded_children = sum(
+            1 for episode in self.episodes if episode.file and episode.folder
+        )
+
+    def child_state_changed(self, child, previous):
+        if self._episodes_by_number.get(child.number) is not child:
+            # a copy of the episode, the season doesn't hold it
+            return
+        self._child_states[previous[0]] -= 1
+        self._child_states[child.state] += 1
+        self._downloaded_children += bool(child.file and child.folder) - previous[1]
+        self._refresh_state()
 
     def _determine_state(self):
-        if len(self.episodes) > 0:
-            if all(episode.state == States.Completed for episode in self.episodes):
+        if total := len(self.episodes):
+            states = self._child_states
+            if states[States.Completed] == total:
                 return States.Completed
-            if any(episode.state == States.Completed for episode in self.episodes):
+            if states[States.Completed]:
                 return States.PartiallyCompleted
-            if all(episode.state == States.Symlinked for episode in self.episodes):
+            if states[States.Symlinked] == total:
                 return States.Symlinked
-            if all(episode.file and episode.folder for episode in self.episodes):
+            if self._downloaded_children == total:
                 return States.Downloaded
             if self.is_scraped():
                 return States.Scraped
-            if all(episode.state == States.Indexed for episode in self.episodes):
+            if states[States.Indexed] == total:
                 return States.Indexed
-            if any(episode.state == States.Requested for episode in self.episodes):
+            if states[States.Requested]:
                 return States.Requested
         return States.Unknown
 
@@ -322,31 +629,55 @@ class Season(MediaItem):
         return f"Season:{self.number}:{self.state.name}"
 
     def fill_in_missing_children(self, other: Self):
-        existing_episodes = [s.number for s in self.episodes]
-        for e in other.episodes:
-            if e.number not in existing_episodes:
-                self.add_episode(e)
+        missing_episodes = []
+        for episode in other.episodes:
+            if self.get_episode(episode.number) is None:
+                self._adopt(episode)
+                missing_episodes.append(episode)
+        if missing_episodes:
+            # both lists are sorted, merge them in one pass
+            self.episodes = list(
+                heapq.merge(self.episodes, missing_episodes, key=_number)
+            )
 
     def represent_children(self):
         return [e.log_string for e in self.episodes]
 
     def add_episode(self, episode):
-        """Add episode to season"""
-        self.episodes.append(episode)
+        """Add episode to season, replacing the episode with the same number"""
+        self._adopt(episode)
+        if (existing := self.get_episode(episode.number)) is not None:
+            index = bisect_left(self.episodes, episode.number, key=_number)
+            self.episodes[index] = episode
+            self._child_states[existing.state] -= 1
+            self._downloaded_children -= bool(existing.file and existing.folder)
+        elif not self.episodes or self.episodes[-1].number < episode.number:
+            self.episodes.append(episode)
+        else:
+            self.episodes.insert(
+                bisect_left(self.episodes, episode.number, key=_number), episode
+            )
+        self._episodes_by_number[episode.number] = episode
+        self._child_states[episode.state] += 1
+        self._downloaded_children += bool(episode.file and episode.folder)
+        self._refresh_state()
+
+    def _adopt(self, episode):
         episode.parent = self
-        episode.item_id.parent_id = self.item_id
-        self.episodes = sorted(self.episodes, key=lambda e: e.number)
+        episode.item_id = ItemId(episode.number, self.item_id)
 
     @property
     def log_string(self):
-        return self.parent.log_string + " S" + str(self.number).zfill(2)
+        return _parent_log_string(self) + " S" + str(self.number).zfill(2)
 
 
 class Episode(MediaItem):
     """Episode class"""
 
+    __slots__ = ("number",)
+    type = "episode"
+
     def __init__(self, item):
-        self.type = "episode"
         self.number = item.get("number", None)
         self.file = item.get("file", None)
         self.item_id = ItemId(self.number)
@@ -367,7 +698,64 @@ class Episode(MediaItem):
 
     @property
     def log_string(self):
-        return f"{self.parent.log_string}E{self.number:02}"
+        return f"{_parent_log_string(self)}E{self.number:02}"
+
+
+def _parent_log_string(item: MediaItem) -> str:
+    if item.parent is None:
+        # not linked to its parent yet
+        return str(item.item_id.parent_id)
+    return item.parent.log_string
+
+
+_UNSET = object()
+
+_number = attrgetter("number")
+
+# private slots that hold indexes over the children, copies get their own
+_CHILD_INDEXES = frozenset(
+    ("_seasons_by_number", "_episodes_by_number", "_child_states")
+)
+
+# attributes that the state of an item is determined by
+_STATE_ATTRIBUTES = frozenset(
+    (
+        "key",
+        "update_folder",
+        "symlinked",
+        "file",
+        "folder",
+        "streams",
+        "title",
+        "imdb_id",
+        "requested_by",
+        "seasons",
+        "episodes",
+    )
+)
+
+_interned_genres: dict[tuple, tuple] = {}
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_genres(genres):
+    """Intern the genres, items with the same genres share a single tuple."""
+    if genres is None:
+        return None
+    key = tuple(_intern(genre) for genre in genres)
+    return _interned_genres.setdefault(key, key)
+
+
+@cache
+def _slot_names(cls) -> tuple[str, ...]:
+    return tuple(
+        name
+        for klass in reversed(cls.__mro__)
+        for name in getattr(klass, "__slots__", ())
+    )
 
 
 def _set_nested_attr(obj, key, value):
@@ -0,0 +1,83 @@
+"""Field patches that services emit instead of whole items.
+
+A patch names the item it applies to and the fields it changes. The container
+applies it to its own copy of the item, so a service that only scraped streams
+doesn't send the whole show back, and doesn't overwrite changes made to the
+item while it was running."""
+
+import abc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from program.media.item import ItemId, MediaItem
+
+
+@dataclass(frozen=True)
+class ItemPatch(abc.ABC):
+    item_id: ItemId
+
+    @abc.abstractmethod
+    def apply(self, item: MediaItem) -> None:
+        """Change the fields of `item`, the container's copy of the item."""
+
+    @property
+    def log_string(self) -> str:
+        return f"{self.__class__.__name__}:{self.item_id}"
+
+
+@dataclass(frozen=True)
+class SetFields(ItemPatch):
+    """Assign fields of the item, and of its seasons or episodes."""
+
+    fields: dict[str, Any]
+    children: tuple["SetFields", ...] = ()
+
+    def apply(self, item: MediaItem) -> None:
+        for name, value in self.fields.items():
+            setattr(item, name, value)
+        for patch in self.children:
+            if (child := _get_child(item, patch.item_id)) is not None:
+                patch.apply(child)
+
+
+@dataclass(frozen=True)
+class AddStreams(ItemPatch):
+    """Add scraped streams and count the scrape, keeping at most `limit` of
+    the item's best streams."""
+
+    streams: dict[str, Any]
+    scraped_at: datetime
+    limit: int | None = None
+
+    def apply(self, item: MediaItem) -> None:
+        item.add_streams(self.streams, self.limit)
+        item.scraped_at = self.scraped_at
+        item.scraped_times += 1
+
+
+@dataclass(frozen=True)
+class MarkSymlinked(ItemPatch):
+    """Record an attempt to symlink the item."""
+
+    symlinked: bool
+    symlinked_at: datetime
+    folder: str | None
+    update_folder: str | None
+
+    def apply(self, item: MediaItem) -> None:
+        item.folder = self.folder
+        item.update_folder = self.update_folder
+        item.symlinked = self.symlinked
+        item.symlinked_at = self.symlinked_at
+        item.symlinked_times += 1
+
+
+def _get_child(item: MediaItem, item_id: ItemId) -> MediaItem | None:
+    if item_id.parent_id != item.item_id:
+        return None
+    if hasattr(item, "seasons"):
+        return item.get_season(item_id.value)
+    if hasattr(item, "episodes"):
+        return item.get_episode(item_id.value)
+    return None
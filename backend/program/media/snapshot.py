@@ -0,0 +1,101 @@
+"""Snapshot format for the MediaItemContainer"""
+
+import gzip
+import io
+import pickle
+from typing import BinaryIO, Collection, Generator
+
+from program.media.item import MediaItem
+from RTN import Torrent
+from RTN.models import ParsedData
+from utils.logger import logger
+
+SNAPSHOT_FORMAT = "iceberg-media-snapshot"
+SNAPSHOT_VERSION = 1
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class UnsupportedSnapshotError(Exception):
+    """The snapshot was written in a version of the format this build can't read."""
+
+
+def write_snapshot(file: BinaryIO, items: Collection[MediaItem]) -> None:
+    """Write a snapshot of the given top level items (movies and shows).
+
+    The snapshot is a gzip stream of pickle records: a header with the format,
+    schema version and item count, followed by one self-contained record per
+    item with its seasons and episodes. It is written with the C pickler, which
+    is a lot faster than dill, and can be loaded one item at a time.
+    """
+    with gzip.GzipFile(fileobj=file, mode="wb", compresslevel=1) as stream:
+        header = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "count": len(items),
+        }
+        pickle.dump(header, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        # every item gets a self-contained record, so it can be loaded on its own
+        for item in items:
+            _dump(item, stream)
+
+
+def read_snapshot(file: BinaryIO) -> Generator[MediaItem, None, None]:
+    """Yield the items of a snapshot written by `write_snapshot` one by one."""
+    with gzip.GzipFile(fileobj=file, mode="rb") as stream:
+        header = pickle.load(stream)  # noqa: S301
+        if not isinstance(header, dict) or header.get("format") != SNAPSHOT_FORMAT:
+            raise pickle.UnpicklingError("Not a media snapshot")
+        if header["version"] != SNAPSHOT_VERSION:
+            raise UnsupportedSnapshotError(
+                f"Unsupported media snapshot version {header['version']}"
+            )
+        count = header["count"]
+        progress_step = max(count // 10, 1)
+        for loaded in range(1, count + 1):
+            yield pickle.load(stream)  # noqa: S301
+            if loaded % progress_step == 0:
+                logger.info("Loaded %s/%s cached media items", loaded, count)
+
+
+def dumps_item(item: MediaItem) -> bytes:
+    """Pickle a single item with its children, in the format of a snapshot record."""
+    stream = io.BytesIO()
+    _dump(item, stream)
+    return stream.getvalue()
+
+
+def loads_item(data: bytes) -> MediaItem:
+    """Load an item pickled by `dumps_item`."""
+    return pickle.loads(data)  # noqa: S301
+
+
+def _dump(item: MediaItem, stream: BinaryIO) -> None:
+    pickler = pickle.Pickler(stream, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = _DISPATCH_TABLE
+    pickler.dump(item)
+
+
+def _reduce_torrent(torrent: Torrent):
+    return _construct_model, (Torrent, torrent.__dict__)
+
+
+def _reduce_parsed_data(data: ParsedData):
+    return _construct_model, (ParsedData, data.__dict__)
+
+
+def _construct_model(model, values: dict):
+    """Rebuild a pydantic model from its stored fields.
+
+    The fields were validated when the model was created, so this skips
+    validation and `model_construct`, and sets the instance state directly."""
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__pydantic_fields_set__", set(values))
+    object.__setattr__(instance, "__pydantic_extra__", None)
+    object.__setattr__(instance, "__pydantic_private__", None)
+    return instance
+
+
+# Streams make up most of a snapshot, store their fields instead of the pickled
+# pydantic models, which are slow to load and a lot larger.
+_DISPATCH_TABLE = {Torrent: _reduce_torrent, ParsedData: _reduce_parsed_data}
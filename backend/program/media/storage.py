@@ -0,0 +1,370 @@
+"""Persistent storage backends for the MediaItemContainer"""
+
+import contextlib
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+from copy import copy
+from typing import Generator, Iterable
+
+from program.media.container import ColdItem
+from program.media.item import Episode, ItemId, MediaItem, Season, Show
+from program.media.snapshot import dumps_item, loads_item
+from utils.logger import logger
+
+_COLUMNS = "item_id, parent_id, number, type, state, imdb_id, tvdb_id, tmdb_id, data"
+
+_TABLES = ("items", "seasons", "episodes")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    item_id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    number INTEGER,
+    type TEXT NOT NULL,
+    state TEXT NOT NULL,
+    imdb_id TEXT,
+    tvdb_id TEXT,
+    tmdb_id TEXT,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {table}_parent_id ON {table} (parent_id, number);
+CREATE INDEX IF NOT EXISTS {table}_state ON {table} (state);
+CREATE INDEX IF NOT EXISTS {table}_imdb_id ON {table} (imdb_id);
+"""
+
+
+class SqliteStore:
+    """SQLite backed store for media items.
+
+    Movies and shows are stored in the `items` table, seasons and episodes in
+    tables of their own. Every row holds the pickled item without its parent
+    and children, so writing an upserted episode only touches its own row.
+    The database runs in WAL mode, a crash loses at most the last transaction.
+    State and id queries are answered in SQL, without loading the items.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for table in _TABLES:
+            self.connection.executescript(_SCHEMA.format(table=table))
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def upsert(self, item: MediaItem) -> None:
+        """Write the item and its children, and refresh the state of its parents."""
+        self.upsert_many([item])
+
+    def upsert_many(self, items: Iterable[MediaItem]) -> None:
+        """Write several items in one transaction."""
+        with self.lock, self.connection:
+            for item in items:
+                for child in item.walk():
+                    self.connection.execute(
+                        f"INSERT OR REPLACE INTO {_table(child)} ({_COLUMNS})"  # noqa: S608
+                        + " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        _row(child),
+                    )
+                parent = item.parent
+                while parent is not None:
+                    self.connection.execute(
+                        f"UPDATE {_table(parent)} SET state = ? WHERE item_id = ?",  # noqa: S608
+                        (parent.state.value, str(parent.item_id)),
+                    )
+                    parent = parent.parent
+
+    def remove(self, item: MediaItem) -> None:
+        """Delete the item and its children."""
+        item_id = str(item.item_id)
+        with self.lock, self.connection:
+            for table in _TABLES:
+                self.connection.execute(
+                    f"DELETE FROM {table} WHERE item_id = ? OR item_id LIKE ?",  # noqa: S608
+                    (item_id, f"{item_id}/%"),
+                )
+            if item.parent is not None:
+                self.connection.execute(
+                    f"UPDATE {_table(item.parent)} SET state = ? WHERE item_id = ?",  # noqa: S608
+                    (item.parent.state.value, str(item.parent.item_id)),
+                )
+
+    def load(self) -> Generator[MediaItem, None, None]:
+        """Yield all stored movies and shows with their seasons and episodes attached."""
+        with self.lock:
+            items = {
+                item_id: pickle.loads(data)  # noqa: S301
+                for item_id, data in self.connection.execute(
+                    "SELECT item_id, data FROM items"
+                )
+            }
+            seasons = self._load_children("seasons", items)
+            self._load_children("episodes", seasons)
+        # children were attached to the lists directly, recount their states
+        for item in (*seasons.values(), *items.values()):
+            item.refresh_state()
+        yield from items.values()
+
+    def _load_children(self, table: str, parents: dict) -> dict:
+        children = {}
+        for item_id, parent_id, data in self.connection.execute(
+            f"SELECT item_id, parent_id, data FROM {table}"  # noqa: S608
+            + " ORDER BY parent_id, number"
+        ):
+            if (parent := parents.get(parent_id)) is None:
+                logger.error("Skipping stored %s without parent", item_id)
+                continue
+            child = pickle.loads(data)  # noqa: S301
+            child.parent = parent
+            getattr(parent, table).append(child)
+            children[item_id] = child
+        return children
+
+    def get_item_ids_with_state(self, state) -> list[str]:
+        """Get the ids of all items with the given state."""
+        with self.lock:
+            return [
+                item_id
+                for table in _TABLES
+                for (item_id,) in self.connection.execute(
+                    f"SELECT item_id FROM {table} WHERE state = ?",  # noqa: S608
+                    (state.value,),
+                )
+            ]
+
+    def count(self, state) -> int:
+        """Count the items with the given state."""
+        with self.lock:
+            return sum(
+                self.connection.execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE state = ?",  # noqa: S608
+                    (state.value,),
+                ).fetchone()[0]
+                for table in _TABLES
+            )
+
+    def get_item_id_by_imdb_id(self, imdb_id: str) -> str | None:
+        """Get the id of the item with the given imdb id, movies and shows first."""
+        with self.lock:
+            for table in _TABLES:
+                row = self.connection.execute(
+                    f"SELECT item_id FROM {table} WHERE imdb_id = ?",  # noqa: S608
+                    (imdb_id,),
+                ).fetchone()
+                if row:
+                    return row[0]
+        return None
+
+
+class ColdStore:
+    """SQLite backed cold tier for completed movies and shows.
+
+    Every row holds the summary the container keeps in memory, and the
+    pickled item with its seasons and episodes, which is loaded again when
+    the item is looked up. A row is written when the item is evicted and
+    deleted when the item is removed; while an item is resident its row may be
+    stale, the resident item always takes precedence.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cold ("
+            + "item_id TEXT PRIMARY KEY, summary BLOB NOT NULL, data BLOB NOT NULL)"
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def put_many(self, items: Iterable[tuple[ColdItem, MediaItem]]) -> None:
+        """Write evicted items with their summaries in one transaction."""
+        rows = [
+            (
+                str(summary.item_id),
+                pickle.dumps(summary, protocol=pickle.HIGHEST_PROTOCOL),
+                dumps_item(item),
+            )
+            for summary, item in items
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cold (item_id, summary, data) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def get(self, item_id: ItemId) -> MediaItem | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT data FROM cold WHERE item_id = ?", (str(item_id),)
+            ).fetchone()
+        return loads_item(row[0]) if row else None
+
+    def remove(self, item_id: ItemId) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM cold WHERE item_id = ?", (str(item_id),)
+            )
+
+    def summaries(self) -> Generator[ColdItem, None, None]:
+        """Yield the summaries of all evicted items."""
+        with self.lock:
+            rows = self.connection.execute("SELECT summary FROM cold").fetchall()
+        for (summary,) in rows:
+            yield pickle.loads(summary)  # noqa: S301
+
+
+def _table(item: MediaItem) -> str:
+    match item:
+        case Season():
+            return "seasons"
+        case Episode():
+            return "episodes"
+        case _:
+            return "items"
+
+
+def _row(item: MediaItem) -> tuple:
+    """Map an item to a table row, children are stored in rows of their own."""
+    stripped = copy(item)
+    if isinstance(stripped, Show):
+        stripped.seasons = []
+    elif isinstance(stripped, Season):
+        stripped.episodes = []
+    parent_id = item.item_id.parent_id
+    return (
+        str(item.item_id),
+        str(parent_id) if parent_id is not None else None,
+        getattr(item, "number", None),
+        item.__class__.__name__,
+        item.state.value,
+        item.imdb_id,
+        _text(item.tvdb_id),
+        _text(item.tmdb_id),
+        pickle.dumps(stripped, protocol=pickle.HIGHEST_PROTOCOL),
+    )
+
+
+def _text(value) -> str | None:
+    return str(value) if value is not None else None
+
+
+def _is_attached(item: MediaItem, container) -> bool:
+    """Whether the item is top-level or its parent is in the container."""
+    parent_id = item.item_id.parent_id
+    return parent_id is None or parent_id in container
+
+
+class Journal:
+    """Append-only journal of the changes made to a MediaItemContainer.
+
+    Every upsert appends the upserted item (items are pickled without their
+    parent) and every removal appends the id of the removed item. Replaying
+    the journal on top of the last snapshot restores the container. Every
+    append is synced to disk, so a crash of the process or of the system
+    loses at most the records that were being written. `rotate` moves the
+    journal aside before a new snapshot is taken, the rotated journal is
+    deleted once the snapshot is safely on disk.
+    """
+
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self.rotated_filename = f"{self.filename}.1"
+        self.lock = threading.Lock()
+        self.file = open(self.filename, "ab")  # noqa: SIM115
+
+    @property
+    def size(self) -> int:
+        return self.file.tell()
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+    def upsert(self, item: MediaItem) -> None:
+        self._append([("upsert", item)])
+
+    def upsert_many(self, items: Iterable[MediaItem]) -> None:
+        self._append([("upsert", item) for item in items])
+
+    def remove(self, item: MediaItem) -> None:
+        self._append([("remove", item.item_id)])
+
+    def _append(self, records: list[tuple]) -> None:
+        data = b"".join(
+            pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            for record in records
+        )
+        with self.lock:
+            self.file.write(data)
+            self.file.flush()
+            # a batch of records is synced at once, see `upsert_many`
+            os.fsync(self.file.fileno())
+
+    def rotate(self) -> None:
+        """Move the current journal aside and start a new one."""
+        with self.lock:
+            self.file.close()
+            if os.path.exists(self.rotated_filename):
+                # a previous compaction didn't finish, keep both journals
+                with open(self.rotated_filename, "ab") as rotated, open(
+                    self.filename, "rb"
+                ) as current:
+                    shutil.copyfileobj(current, rotated)
+                os.remove(self.filename)
+            else:
+                os.replace(self.filename, self.rotated_filename)
+            self.file = open(self.filename, "ab")  # noqa: SIM115
+
+    def discard_rotated(self) -> None:
+        """Delete the rotated journal once its changes are in a snapshot."""
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.rotated_filename)
+
+    def replay(self, container) -> int:
+        """Apply the rotated and the current journal to the container."""
+        replayed = 0
+        with self.lock:
+            for filename in (self.rotated_filename, self.filename):
+                replayed += self._replay_file(filename, container)
+        return replayed
+
+    def _replay_file(self, filename: str, container) -> int:
+        if not os.path.exists(filename):
+            return 0
+        replayed = 0
+        with open(filename, "rb") as file:
+            while True:
+                offset = file.tell()
+                try:
+                    operation, payload = pickle.load(file)  # noqa: S301
+                except EOFError:
+                    break
+                except Exception:
+                    logger.error(
+                        "Journal %s is truncated at byte %s, dropping the rest",
+                        filename,
+                        offset,
+                    )
+                    file.close()
+                    os.truncate(filename, offset)
+                    break
+                if operation == "remove":
+                    container.remove(payload)
+                elif _is_attached(payload, container):
+                    container.upsert(payload)
+                else:
+                    logger.error("Skipping journaled %s without parent", payload)
+                replayed += 1
+        return replayed
@@ -0,0 +1,46 @@
+"""Compact records of scraped streams"""
+
+from typing import NamedTuple
+
+from RTN import Torrent
+
+
+class Stream(NamedTuple):
+    """A scraped torrent with its rank and the parsed fields worth keeping.
+
+    Scrapers rank RTN `Torrent` models, which carry the whole parse result and
+    cost a few kilobytes each. Items keep this record instead."""
+
+    infohash: str
+    raw_title: str
+    rank: int
+    parsed_title: str
+    resolution: tuple[str, ...]
+    season: tuple[int, ...]
+    episode: tuple[int, ...]
+
+    @classmethod
+    def of(cls, stream: "Stream | Torrent") -> "Stream":
+        """Compact a ranked torrent, records are returned as they are."""
+        if isinstance(stream, Stream):
+            return stream
+        data = stream.data
+        return cls(
+            infohash=stream.infohash,
+            raw_title=stream.raw_title,
+            rank=stream.rank,
+            parsed_title=data.parsed_title,
+            resolution=tuple(data.resolution),
+            season=tuple(data.season),
+            episode=tuple(data.episode),
+        )
+
+
+def best_streams(streams: dict, limit: int | None = None) -> dict[str, Stream]:
+    """Compact the streams and keep the `limit` best ranked ones, best first."""
+    ranked = sorted(map(Stream.of, streams.values()), key=_rank, reverse=True)
+    return {stream.infohash: stream for stream in ranked[:limit]}
+
+
+def _rank(stream: Stream) -> int:
+    return stream.rank or 0
@@ -0,0 +1,127 @@
+"""Parsing and ranking of scraped titles, in worker processes when enabled
+
+Parsing torrent titles and feeds is CPU bound and holds the GIL, so on
+threads it competes with the API server and the event loop. The functions
+here take the titles of a whole response as one batch. With
+`pipeline.processes` set they run in a pool of worker processes, and only
+compact results come back: `Stream` records of the fetched torrents, or
+episode numbers per file name. Without the pool they run in the calling
+thread.
+"""
+
+import contextlib
+import multiprocessing
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable
+
+import xmltodict
+from program.media.stream import Stream, best_streams
+from RTN import RTN
+from RTN.exceptions import GarbageTorrent
+from RTN.parser import episodes_from_season
+from utils.logger import logger
+
+_pool: ProcessPoolExecutor | None = None
+# held while the pool is started or stopped, jobs read `_pool` without it
+_pool_lock = threading.Lock()
+
+
+def start_workers(processes: int) -> None:
+    """Start the worker processes, nothing to do for 0 processes.
+
+    The workers are forked, so call this before any other thread starts: a
+    child forked while another thread holds a lock can deadlock on it. They
+    aren't spawned, that would import the entry point in every worker."""
+    global _pool  # noqa: PLW0603
+    with _pool_lock:
+        if processes <= 0 or _pool is not None:
+            return
+        pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork"))
+        # forking pools start all of their workers with the first job
+        pool.submit(int).result()
+        _pool = pool
+    logger.info("Started %s parsing processes", processes)
+
+
+def stop_workers() -> None:
+    """Stop the worker processes, jobs run in the calling thread from then on."""
+    global _pool  # noqa: PLW0603
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _run(fn: Callable, *args):
+    # read once, the workers can be stopped by another thread at any time
+    pool = _pool
+    if pool is not None:
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            logger.error("Parsing processes died, parsing in threads from now on")
+            stop_workers()
+        except (CancelledError, RuntimeError):
+            # a stopped pool refuses new jobs and cancels the queued ones,
+            # those run here instead
+            if _pool is pool:
+                raise
+    return fn(*args)
+
+
+def rank_streams(
+    rtn: RTN, titles: Iterable[tuple[str, str]], correct_title: str
+) -> dict[str, Stream]:
+    """Rank `(raw_title, infohash)` pairs against the correct title, the
+    torrents RTN would fetch are returned best first."""
+    return _run(_rank, rtn, list(titles), correct_title)
+
+
+def rank_torznab(rtn: RTN, feed: bytes, correct_title: str) -> tuple[dict[str, Stream], int]:
+    """Parse a torznab feed and rank its items like `rank_streams`, also
+    returns the number of items in the feed."""
+    return _run(_rank_torznab, rtn, feed, correct_title)
+
+
+def season_episodes(filenames: Iterable[str], season: int) -> dict[str, list[int]]:
+    """Episode numbers of `season` found in each of the file names."""
+    return _run(_season_episodes, set(filenames), season)
+
+
+def _rank(rtn: RTN, titles: list[tuple[str, str]], correct_title: str) -> dict[str, Stream]:
+    torrents = {}
+    for raw_title, infohash in titles:
+        with contextlib.suppress(GarbageTorrent):
+            torrent = rtn.rank(
+                raw_title=raw_title,
+                infohash=infohash,
+                correct_title=correct_title,
+                remove_trash=True,
+            )
+            if torrent.fetch:
+                torrents[torrent.infohash] = torrent
+    return best_streams(torrents)
+
+
+def _rank_torznab(rtn: RTN, feed: bytes, correct_title: str) -> tuple[dict[str, Stream], int]:
+    items = xmltodict.parse(feed)["rss"]["channel"].get("item", [])
+    # a feed with a single item has no list
+    if isinstance(items, dict):
+        items = [items]
+    titles = []
+    for item in items:
+        attrs = item.get("torznab:attr", [])
+        if isinstance(attrs, dict):
+            attrs = [attrs]
+        infohash = next(
+            (attr.get("@value") for attr in attrs if attr.get("@name") == "infohash"), None
+        )
+        if infohash and item.get("title"):
+            titles.append((item["title"], infohash))
+    return _rank(rtn, titles, correct_title), len(items)
+
+
+def _season_episodes(filenames: set[str], season: int) -> dict[str, list[int]]:
+    return {filename: episodes_from_season(filename, season) for filename in filenames}
@@ -4,23 +4,30 @@ import os
 import threading
 import time
 import traceback
-from concurrent.futures import Future, ThreadPoolExecutor
-from datetime import datetime
-from queue import Empty, Queue
+from collections import defaultdict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from queue import Empty
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from coverage import Coverage
 from deepdiff.diff import DeepDiff, PrettyOrderedSet
 from program.content import Listrr, Mdblist, Overseerr, PlexWatchlist
+from program.event_queue import EventQueue, requester_of
+from program.executors import create_executors
 from program.indexers.trakt import TraktIndexer
 from program.libaries import SymlinkLibrary
 from program.media.container import MediaItemContainer
-from program.media.item import MediaItem
+from program.media.item import ItemId, MediaItem
+from program.media.patch import ItemPatch
 from program.media.state import States
+from program.media.storage import ColdStore, SqliteStore
+from program.parsing import start_workers, stop_workers
 from program.realdebrid import Debrid
+from program.retry import RETRY_INTERVAL, RetryScheduler, retry_at, retry_roots
 from program.scrapers import Scraping
 from program.settings.manager import settings_manager
-from program.state_transition import process_event
+from program.state_transition import SOURCE_SERVICES, process_event
 from program.symlink import Symlinker
 from program.types import Event, ProcessedEvent, Service
 from program.updaters.plex import PlexUpdater
@@ -28,6 +35,11 @@ from utils import data_dir_path
 from utils.logger import logger
 from utils.utils import Pickly
 
+# events the run loop takes from the queue and commits at once
+EVENT_BATCH_SIZE = 100
+# seconds the run loop waits before it looks at a full stage again
+STAGE_WAIT = 0.1
+
 
 class Program(threading.Thread):
     """Program class"""
@@ -36,9 +48,14 @@ class Program(threading.Thread):
         super().__init__(name="Iceberg")
         self.running = False
         self.startup_args = args
+        # event loop of the server, set before `start` to run services on it
+        # with the asyncio engine
+        self.loop = None
         logger.configure_logger(
             debug=settings_manager.settings.debug, log=settings_manager.settings.log
         )
+        # forked while the program is still single threaded
+        start_workers(settings_manager.settings.pipeline.processes)
 
     def initialize_services(self):
         self.requesting_services = {
@@ -70,7 +87,14 @@ class Program(threading.Thread):
         logger.info("Iceberg v%s starting!", settings_manager.settings.version)
         settings_manager.register_observer(self.initialize_services)
         self.initialized = False
-        self.event_queue = Queue()
+        pipeline = settings_manager.settings.pipeline
+        self.event_queue = EventQueue(pipeline.queue_size, pipeline.retry_queue_size)
+        # (service, item_id) of the jobs submitted and not done yet
+        self._in_flight: set[tuple[Service, ItemId]] = set()
+        self._in_flight_lock = threading.Lock()
+        self.retries = RetryScheduler()
+        # container generation the retries are up to date with
+        self._retry_generation = None
         os.makedirs(data_dir_path, exist_ok=True)
 
         try:
@@ -88,27 +112,78 @@ class Program(threading.Thread):
 
         self.media_items = MediaItemContainer()
         if not self.startup_args.ignore_cache:
-            self.pickly = Pickly(self.media_items, data_dir_path)
-            self.pickly.start()
+            # attached first, the items loaded from storage replace their
+            # evicted copies
+            self.media_items.use_cold_store(ColdStore(data_dir_path / "media.cold"))
+            if settings_manager.settings.storage.backend == "sqlite":
+                self.media_items.use_store(SqliteStore(data_dir_path / "media.db"))
+            else:
+                self.pickly = Pickly(self.media_items, data_dir_path)
+                self.pickly.start()
         if not len(self.media_items):
             # seed initial MIC with Library State
-            for item in self.services[SymlinkLibrary].run():
-                self.media_items.upsert(item)
+            self.media_items.upsert_many(self.services[SymlinkLibrary].run())
         self.scheduler = BackgroundScheduler()
-        self.executor = ThreadPoolExecutor(thread_name_prefix="Worker")
+        self.executors = create_executors(self.services, self.loop)
         self._schedule_services()
         self._schedule_functions()
         super().start()
         self.scheduler.start()
         self.running = True
 
-    def _retry_library(self) -> None:
-        for item_id, item in self.media_items.get_incomplete_items().items():
-            self.event_queue.put(Event(emitted_by=self.__class__, item=item))
+    def _retry_items(self) -> None:
+        """Queue the items whose retry is due, see `retry_roots` for the shows
+        and seasons among them."""
+        self._update_retries()
+        now = datetime.now()
+        due = []
+        while (item_id := self.retries.pop_due(now)) is not None:
+            # retried again later unless the item changes in the meantime
+            self.retries.schedule(item_id, now + RETRY_INTERVAL)
+            if (item := self.media_items.get(item_id)) is not None:
+                due.append(item)
+        roots = retry_roots(due)
+        for queued, item in enumerate(roots):
+            # container items are shared snapshots, services get their own copy
+            if not self.event_queue.put(Event(emitted_by=self.__class__, item=item.copy())):
+                logger.debug("Event queue is busy, deferring the due retries")
+                for deferred in roots[queued:]:
+                    self.retries.schedule(deferred.item_id, now)
+                break
+
+    def _update_retries(self) -> None:
+        """Reschedule the retries of the items changed since the last update,
+        from the container's change log."""
+        generation = self.media_items.generation
+        changes = (
+            None
+            if self._retry_generation is None
+            else self.media_items.changes_since(self._retry_generation)
+        )
+        now = datetime.now()
+        if changes is None:
+            # on startup everything is retried right away, when the change
+            # log doesn't reach back far enough everything is rescheduled
+            delay = timedelta(0) if self._retry_generation is None else RETRY_INTERVAL
+            self.retries.clear()
+            for item_id, item in self.media_items.get_incomplete_items().items():
+                self.retries.schedule(item_id, retry_at(item, now, delay))
+        else:
+            states = {change.item_id: change.new_state for change in changes}
+            for item_id, state in states.items():
+                if state in (None, States.Completed, States.PartiallyCompleted):
+                    self.retries.schedule(item_id, None)
+                elif (item := self.media_items.get(item_id)) is not None:
+                    self.retries.schedule(item_id, retry_at(item, now))
+        self._retry_generation = generation
 
     def _schedule_functions(self) -> None:
         """Schedule each service based on its update interval."""
-        scheduled_functions = {self._retry_library: {"interval": 60 * 10}}
+        scheduled_functions = {self._retry_items: {"interval": 60}}
+        if settings_manager.settings.storage.cold_tier:
+            scheduled_functions[self.media_items.evict_completed] = {
+                "interval": 60 * 10
+            }
         for func, config in scheduled_functions.items():
             self.scheduler.add_job(
                 func,
@@ -170,8 +245,12 @@ class Program(threading.Thread):
         self, future: Future, service: Service, input_item: MediaItem
     ) -> None:
         """Callback to add the results from a future emitted by a service to the event queue."""
+        events = []
         try:
             for item in future.result():
+                if isinstance(item, ItemPatch):
+                    events.append(Event(emitted_by=service, patch=item))
+                    continue
                 if not isinstance(item, MediaItem):
                     logger.error(
                         "Service %s emitted item %s of type %s, skipping",
@@ -180,15 +259,34 @@ class Program(threading.Thread):
                         item.__class__.__name__,
                     )
                     continue
-                self.event_queue.put(Event(emitted_by=service, item=item))
+                events.append(Event(emitted_by=service, item=item))
         except Exception:
             logger.error(
                 "Service %s failed with exception %s",
                 service.__name__,
                 traceback.format_exc(),
             )
+        finally:
+            # the job is done before its results are queued, processing them
+            # may submit the item to the same service again
+            if input_item is not None:
+                with self._in_flight_lock:
+                    self._in_flight.discard((service, input_item.item_id))
+        requested_by = requester_of(input_item) if input_item is not None else None
+        for event in events:
+            self.event_queue.put(event, requested_by=requested_by)
 
     def _submit_job(self, service: Service, item: MediaItem | None) -> None:
+        if item is not None:
+            with self._in_flight_lock:
+                if (service, item.item_id) in self._in_flight:
+                    logger.debug(
+                        "%s is already running for %s, skipping",
+                        service.__name__,
+                        item.log_string,
+                    )
+                    return
+                self._in_flight.add((service, item.item_id))
         logger.debug(
             f"Submitting service {service.__name__} to the pool"
             + (
@@ -197,12 +295,9 @@ class Program(threading.Thread):
                 else ""
             )
         )
-        func = self.services[service].run
-        future = (
-            self.executor.submit(func)
-            if item is None
-            else self.executor.submit(func, item)
-        )
+        executor = self.executors[service]
+        func = getattr(self.services[service], executor.method)
+        future = executor.submit(func) if item is None else executor.submit(func, item)
         future.add_done_callback(lambda f: self._process_future_item(f, service, item))
 
     def run(self):
@@ -210,33 +305,94 @@ class Program(threading.Thread):
             if not self.validate():
                 time.sleep(1)
                 continue
-            try:
-                event: Event = self.event_queue.get(timeout=1)
-            except Empty:
+            events = self._next_events(self._stage_room())
+            if not events:
                 # Unblock after waiting in case we are no longer supposed to be running
                 continue
-            existing_item = self.media_items.get(event.item.item_id, None)
-            func = (
-                process_event_and_collect_coverage
-                if self.startup_args.profile_state_transitions
-                else process_event
-            )
-            updated_item, next_service, items_to_submit = func(
-                existing_item, event.emitted_by, event.item
-            )
+            submissions: dict[tuple, tuple[Service, MediaItem]] = {}
+            # the events of one batch are committed to the container together,
+            # twenty episodes of a season are written as a single season
+            with self.media_items.batch():
+                for events_of_collection in _group_by_collection(events).values():
+                    for event in events_of_collection:
+                        next_service, items_to_submit = self._process_event(event)
+                        for item in items_to_submit:
+                            submissions[(next_service, item.item_id)] = (
+                                next_service,
+                                item,
+                            )
+            for next_service, item in submissions.values():
+                self._submit_job(next_service, item)
+
+    def _stage_room(self) -> int:
+        """Events to take in the next batch, no more than the fullest stage
+        has room for."""
+        rooms = [
+            room for executor in self.executors.values() if (room := executor.room()) is not None
+        ]
+        return min([EVENT_BATCH_SIZE, *rooms])
+
+    def _next_events(self, limit: int = EVENT_BATCH_SIZE) -> list[Event]:
+        """Wait for an event, then take what else is queued up to `limit` events.
+
+        No events are taken while a stage is full: they stay queued, and the
+        services that feed the queue wait for room in turn."""
+        if limit <= 0:
+            time.sleep(STAGE_WAIT)
+            return []
+        try:
+            events = [self.event_queue.get(timeout=1)]
+        except Empty:
+            return []
+        while len(events) < limit:
+            try:
+                events.append(self.event_queue.get_nowait())
+            except Empty:
+                break
+        return events
+
+    def _process_event(self, event: Event) -> tuple[Service, list[MediaItem]]:
+        """Run the state transition for an event and commit the updated item to
+        the container. Returns the service and items to submit next."""
+        existing_item, item = self._event_items(event)
+        if item is None:
+            return None, []
+        func = (
+            process_event_and_collect_coverage
+            if self.startup_args.profile_state_transitions
+            else process_event
+        )
+        updated_item, next_service, items_to_submit = func(
+            existing_item, event.emitted_by, item
+        )
+        if event.patch is not None:
+            # services must not modify the container's items
+            items_to_submit = [submitted.copy() for submitted in items_to_submit]
 
-            # before submitting the item to be processed, commit it to the container
-            if updated_item:
+        # before submitting the item to be processed, commit it to the container
+        if updated_item:
+            if updated_item is not existing_item:
                 self.media_items.upsert(updated_item)
-                if updated_item.state == States.Completed:
-                    logger.debug(
-                        "%s %s has been completed",
-                        updated_item.__class__.__name__,
-                        updated_item.log_string,
-                    )
-
-            for item_to_submit in items_to_submit:
-                self._submit_job(next_service, item_to_submit)
+            if updated_item.state == States.Completed:
+                logger.debug(
+                    "%s %s has been completed",
+                    updated_item.__class__.__name__,
+                    updated_item.log_string,
+                )
+        return next_service, items_to_submit
+
+    def _event_items(self, event: Event) -> tuple[MediaItem | None, MediaItem | None]:
+        """Get the stored item and the item to process for an event."""
+        if event.patch is not None:
+            # the container applies the patch to its own copy, the patched item
+            # is the one the state transition continues with
+            item = self.media_items.apply(event.patch)
+            return item, item
+        if event.emitted_by in SOURCE_SERVICES:
+            # requests are only checked against the stored item, the summary
+            # of a cold item answers that without loading it
+            return self.media_items.peek(event.item.item_id), event.item
+        return self.media_items.get(event.item.item_id, None), event.item
 
     def validate(self):
         return all(
@@ -249,10 +405,16 @@ class Program(threading.Thread):
         )
 
     def stop(self):
-        if hasattr(self, "executor"):
-            self.executor.shutdown(wait=True)
+        if hasattr(self, "executors"):
+            for executor in self.executors.values():
+                executor.shutdown(wait=True)
+        stop_workers()
         if hasattr(self, "pickly"):
             self.pickly.stop()
+        if hasattr(self, "media_items") and self.media_items.store:
+            self.media_items.store.close()
+        if hasattr(self, "media_items") and self.media_items.cold_store:
+            self.media_items.cold_store.close()
         settings_manager.save()
         symlinker_service = self.processing_services.get(Symlinker)
         if symlinker_service:
@@ -264,6 +426,14 @@ class Program(threading.Thread):
         self.running = False
 
 
+def _group_by_collection(events: list[Event]) -> dict[ItemId, list[Event]]:
+    """Group events by the show or movie their item belongs to."""
+    groups = defaultdict(list)
+    for event in events:
+        groups[event.item_id.collection].append(event)
+    return groups
+
+
 def custom_serializer(obj):
     """
     If input object is a type (class), return its name as a string.
@@ -1,14 +1,17 @@
 """Realdebrid module"""
 
+import asyncio
 import time
 from pathlib import Path
 
 from program.media.item import Episode, Movie, Season
+from program.media.patch import SetFields
+from program.parsing import season_episodes
 from program.settings.manager import settings_manager
 from requests import ConnectTimeout
 from RTN.parser import episodes_from_season
 from utils.logger import logger
-from utils.request import get, ping, post
+from utils.request import async_get, get, ping, post
 
 WANTED_FORMATS = [".mkv", ".mp4", ".avi"]
 RD_BASE_URL = "https://api.real-debrid.com/rest/1.0"
@@ -47,10 +50,21 @@ class Debrid:
         """Download movie from real-debrid.com"""
         if not self.is_cached(item):
             return
+        yield self._download(item)
+
+    async def arun(self, item):
+        """Async counterpart of `run`, the availability check runs on the
+        event loop. Downloading is a short chain of dependent calls and stays
+        blocking in a thread."""
+        if not await self.async_is_cached(item):
+            return
+        yield await asyncio.to_thread(self._download, item)
+
+    def _download(self, item) -> SetFields:
         if not self._is_downloaded(item):
             self._download_item(item)
         self._set_file_paths(item)
-        yield item
+        return self._file_paths_patch(item)
 
     def _is_downloaded(self, item):
         """Check if item is already downloaded"""
@@ -90,78 +104,108 @@ class Debrid:
         item.active_stream["alternative_name"] = info.original_filename
         item.active_stream["name"] = info.filename
 
-    def is_cached(self, item):  # noqa: C901
+    def is_cached(self, item):
         """Check if item is cached on real-debrid.com"""
-        if len(item.streams) == 0:
-            return False
-
-        def chunks(lst, n):
-            for i in range(0, len(lst), n):
-                yield lst[i : i + n]
+        processed_stream_hashes = set()
+        for url in self._availability_urls(item):
+            response = get(url, additional_headers=self.auth_headers, response_type=dict)
+            if self._select_cached(item, response.data, processed_stream_hashes):
+                return True
+        logger.debug("No cached streams found for item: %s", item.log_string)
+        return False
 
+    async def async_is_cached(self, item):
+        """Async counterpart of `is_cached` for the asyncio engine."""
         processed_stream_hashes = set()
-        filtered_streams = [
-            hash
-            for hash in item.streams
-            if hash is not None and hash not in processed_stream_hashes
+        for url in self._availability_urls(item):
+            response = await async_get(
+                url, additional_headers=self.auth_headers, response_type=dict
+            )
+            # matching the files parses their names, which holds the event loop
+            if await asyncio.to_thread(
+                self._select_cached, item, response.data, processed_stream_hashes
+            ):
+                return True
+        logger.debug("No cached streams found for item: %s", item.log_string)
+        return False
+
+    @staticmethod
+    def _availability_urls(item) -> list[str]:
+        """Instant availability urls for the streams of item, five at a time"""
+        hashes = [hash for hash in item.streams if hash is not None]
+        return [
+            f"{RD_BASE_URL}/torrents/instantAvailability/{'/'.join(hashes[i : i + 5])}/"
+            for i in range(0, len(hashes), 5)
         ]
 
-        for stream_chunk in chunks(filtered_streams, 5):
-            streams = "/".join(stream_chunk)
-            response = get(
-                f"{RD_BASE_URL}/torrents/instantAvailability/{streams}/",
-                additional_headers=self.auth_headers,
-                response_type=dict,
-            )
-            for stream_hash, provider_list in response.data.items():
-                if stream_hash in processed_stream_hashes:
-                    continue
-                processed_stream_hashes.add(stream_hash)
-                if len(provider_list) == 0:
-                    continue
-                for containers in provider_list.values():
-                    for container in containers:
-                        wanted_files = {}
-                        if isinstance(item, Movie) and all(
-                            file["filesize"] > 200000 for file in container.values()
-                        ):
-                            wanted_files = container
-                        if isinstance(item, Season) and all(
-                            any(
-                                episode.number
-                                in episodes_from_season(file["filename"], item.number)
-                                for file in container.values()
-                            )
-                            for episode in item.episodes
-                        ):
-                            wanted_files = container
-                        if isinstance(item, Episode) and any(
-                            item.number
-                            in episodes_from_season(episode["filename"], item.parent.number)
-                            for episode in container.values()
-                        ):
-                            wanted_files = container
-                        if len(wanted_files) > 0 and all(
-                            item
-                            for item in wanted_files.values()
-                            if Path(item["filename"]).suffix in WANTED_FORMATS
-                        ):
-                            item.set(
-                                "active_stream",
-                                {
-                                    "hash": stream_hash,
-                                    "files": wanted_files,
-                                    "id": None,
-                                },
-                            )
-                            return True
-        logger.debug(
-            "[%s] No cached streams found for item: %s",
-            stream_hash[-6:],
-            item.log_string,
-        )
+    def _select_cached(self, item, availability, processed_stream_hashes) -> bool:  # noqa: C901
+        """Set the first cached stream of availability with the wanted files as
+        the active stream of item"""
+        episodes = self._episodes_in(item, availability)
+        for stream_hash, provider_list in availability.items():
+            if stream_hash in processed_stream_hashes:
+                continue
+            processed_stream_hashes.add(stream_hash)
+            if len(provider_list) == 0:
+                continue
+            for containers in provider_list.values():
+                for container in containers:
+                    wanted_files = {}
+                    if isinstance(item, Movie) and all(
+                        file["filesize"] > 200000 for file in container.values()
+                    ):
+                        wanted_files = container
+                    if isinstance(item, Season) and all(
+                        any(
+                            episode.number in episodes[file["filename"]]
+                            for file in container.values()
+                        )
+                        for episode in item.episodes
+                    ):
+                        wanted_files = container
+                    if isinstance(item, Episode) and any(
+                        item.number in episodes[episode["filename"]]
+                        for episode in container.values()
+                    ):
+                        wanted_files = container
+                    if len(wanted_files) > 0 and all(
+                        item
+                        for item in wanted_files.values()
+                        if Path(item["filename"]).suffix in WANTED_FORMATS
+                    ):
+                        item.set(
+                            "active_stream",
+                            {
+                                "hash": stream_hash,
+                                "files": wanted_files,
+                                "id": None,
+                            },
+                        )
+                        return True
         return False
 
+    @staticmethod
+    def _episodes_in(item, availability) -> dict[str, list[int]]:
+        """Episode numbers of the season of item in every file of availability,
+        parsed in one batch"""
+        if isinstance(item, Season):
+            season = item.number
+        elif isinstance(item, Episode):
+            season = item.parent.number
+        else:
+            return {}
+        return season_episodes(
+            (
+                file["filename"]
+                for provider_list in availability.values()
+                if provider_list
+                for containers in provider_list.values()
+                for container in containers
+                for file in container.values()
+            ),
+            season,
+        )
+
     def _set_file_paths(self, item):
         """Set file paths for item from real-debrid.com"""
         if isinstance(item, Movie):
@@ -171,6 +215,30 @@ class Debrid:
         elif isinstance(item, Episode):
             self._handle_episode_paths(item)
 
+    def _file_paths_patch(self, item) -> SetFields:
+        """Patch with the active stream and the file paths set on the item.
+
+        The active stream is settled now, the other scraped streams are
+        dropped. Episodes downloaded with their season don't need theirs."""
+        active_hash = item.active_stream.get("hash")
+        return SetFields(
+            item.item_id,
+            {
+                "active_stream": item.active_stream,
+                "streams": {
+                    infohash: stream
+                    for infohash, stream in item.streams.items()
+                    if infohash == active_hash
+                },
+                **_file_paths(item),
+            },
+            children=tuple(
+                SetFields(episode.item_id, {"streams": {}, **_file_paths(episode)})
+                for episode in getattr(item, "episodes", ())
+                if episode.file
+            ),
+        )
+
     def _handle_movie_paths(self, item):
         """Set file paths for movie from real-debrid.com"""
         item.set("folder", item.active_stream.get("name"))
@@ -183,16 +251,14 @@ class Debrid:
     def _handle_season_paths(self, season):
         """Set file paths for season from real-debrid.com"""
         for file in season.active_stream["files"].values():
-            for episode in episodes_from_season(file["filename"], season.number):
-                if episode - 1 in range(len(season.episodes)):
-                    season.episodes[episode - 1].set(
-                        "folder", season.active_stream.get("name")
-                    )
-                    season.episodes[episode - 1].set(
+            for number in episodes_from_season(file["filename"], season.number):
+                if (episode := season.get_episode(number)) is not None:
+                    episode.set("folder", season.active_stream.get("name"))
+                    episode.set(
                         "alternative_folder",
                         season.active_stream.get("alternative_name"),
                     )
-                    season.episodes[episode - 1].set("file", file["filename"])
+                    episode.set("file", file["filename"])
 
     def _handle_episode_paths(self, episode):
         """Set file paths for episode from real-debrid.com"""
@@ -251,3 +317,11 @@ class Debrid:
         )
         if response.is_ok:
             return response.data
+
+
+def _file_paths(item) -> dict:
+    return {
+        "folder": item.folder,
+        "alternative_folder": getattr(item, "alternative_folder", None),
+        "file": item.file,
+    }
@@ -0,0 +1,89 @@
+"""Per-item retry times of the incomplete items"""
+
+import heapq
+from datetime import datetime, timedelta
+from itertools import count
+
+from program.media.item import Episode, ItemId, MediaItem, Movie
+from program.media.state import States
+from program.scrapers import Scraping
+
+# how long an item may stay in a state before it is retried
+RETRY_INTERVAL = timedelta(minutes=10)
+
+
+class RetryScheduler:
+    """Min-heap of item ids by the time their retry is due.
+
+    Scheduling an item again replaces its previous time, the outdated heap
+    entry is skipped when it comes up. Taking the due items only touches the
+    heap entries that are due, not the whole library. Not thread safe, the
+    Program's retry job is its only user."""
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, int, ItemId]] = []
+        self._due: dict[ItemId, datetime] = {}
+        self._sequence = count()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, item_id: ItemId) -> bool:
+        return item_id in self._due
+
+    def schedule(self, item_id: ItemId, due_at: datetime | None) -> None:
+        """Retry the item at `due_at`, None cancels its retry."""
+        if due_at is None:
+            self._due.pop(item_id, None)
+            return
+        self._due[item_id] = due_at
+        heapq.heappush(self._heap, (due_at, next(self._sequence), item_id))
+
+    def pop_due(self, now: datetime) -> ItemId | None:
+        """Take the item whose retry is due first, None if none is due."""
+        while self._heap and self._heap[0][0] <= now:
+            due_at, _, item_id = heapq.heappop(self._heap)
+            if self._due.get(item_id) == due_at:
+                del self._due[item_id]
+                return item_id
+        return None
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._due.clear()
+
+
+def retry_roots(items: list[MediaItem]) -> list[MediaItem]:
+    """The items to retry for the due items, each of them once.
+
+    A show or season that needs to be indexed again is indexed with its
+    children, it stands in for its due descendants. Any other show or season
+    is not retried itself, not every state has a transition for it: its
+    incomplete episodes are retried in their own state instead."""
+    reindexed = {item.item_id for item in items if _needs_indexing(item)}
+    roots = {}
+    for item in items:
+        if any(parent_id in reindexed for parent_id in item.item_id.ancestors()):
+            continue
+        if isinstance(item, (Movie, Episode)) or item.item_id in reindexed:
+            roots.setdefault(item.item_id, item)
+            continue
+        for child in item.walk():
+            if isinstance(child, Episode) and child.state != States.Completed:
+                roots.setdefault(child.item_id, child)
+    return list(roots.values())
+
+
+def _needs_indexing(item: MediaItem) -> bool:
+    return item.state in (States.Unknown, States.Requested)
+
+
+def retry_at(item: MediaItem, now: datetime, delay: timedelta = RETRY_INTERVAL) -> datetime | None:
+    """When to retry an item that reached its state at `now`, None if it is
+    done. Indexed items wait until they may be scraped again and are
+    released, the others are retried after `delay`."""
+    if item.state in (States.Completed, States.PartiallyCompleted):
+        return None
+    if item.state == States.Indexed and item.aired_at is not None:
+        return max(Scraping.next_scrape_at(item), item.aired_at, now)
+    return now + delay
@@ -1,6 +1,8 @@
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 
 from program.media.item import MediaItem
+from program.media.patch import AddStreams
 from program.scrapers.annatar import Annatar
 from program.scrapers.jackett import Jackett
 from program.scrapers.orionoid import Orionoid
@@ -25,12 +27,39 @@ class Scraping:
     def run(self, item: MediaItem):
         if not self._can_we_scrape(item):
             yield None
+        known_streams = set(item.streams)
         for service in self.services.values():
             if service.initialized:
                 item = next(service.run(item))
-        item.set("scraped_at", datetime.now())
-        item.set("scraped_times", item.scraped_times + 1)
-        yield item
+        yield self._streams_patch(item, known_streams)
+
+    async def arun(self, item: MediaItem):
+        """Async counterpart of `run`. Scrapers with an `arun` run on the
+        event loop, the others in a thread. They still run one after another,
+        each adds its streams to the item."""
+        if not self._can_we_scrape(item):
+            yield None
+        known_streams = set(item.streams)
+        for service in self.services.values():
+            if not service.initialized:
+                continue
+            if hasattr(service, "arun"):
+                item = await anext(service.arun(item))
+            else:
+                item = await asyncio.to_thread(next, service.run(item))
+        yield self._streams_patch(item, known_streams)
+
+    def _streams_patch(self, item: MediaItem, known_streams: set) -> AddStreams:
+        return AddStreams(
+            item.item_id,
+            streams={
+                infohash: stream
+                for infohash, stream in item.streams.items()
+                if infohash not in known_streams
+            },
+            scraped_at=datetime.now(),
+            limit=self.settings.max_streams,
+        )
 
     def validate(self):
         if not (
@@ -49,6 +78,14 @@ class Scraping:
 
     @staticmethod
     def should_submit(item: MediaItem) -> bool:
+        return datetime.now() > Scraping.next_scrape_at(item)
+
+    @staticmethod
+    def next_scrape_at(item: MediaItem) -> datetime:
+        """When the item may be scraped again, the more often it has been
+        scraped the longer it waits."""
+        if not item.scraped_at:
+            return datetime.min
         settings = settings_manager.settings.scraping
         scrape_time = 5  # 5 seconds by default
 
@@ -59,7 +96,4 @@ class Scraping:
         elif item.scraped_times > 10:
             scrape_time = settings.after_10 * 60 * 60
 
-        return (
-            not item.scraped_at
-            or (datetime.now() - item.scraped_at).total_seconds() > scrape_time
-        )
+        return item.scraped_at + timedelta(seconds=scrape_time)
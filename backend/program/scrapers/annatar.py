@@ -1,15 +1,14 @@
 """ Annatar scraper module """
 
-import contextlib
 from typing import Dict
 
 from program.media.item import Episode, Season, Show
+from program.parsing import rank_streams
 from program.settings.manager import settings_manager
 from program.settings.versions import models
 from requests import ConnectTimeout, ReadTimeout
 from requests.exceptions import RequestException
-from RTN import RTN, Torrent, sort_torrents
-from RTN.exceptions import GarbageTorrent
+from RTN import RTN
 from utils.logger import logger
 from utils.request import RateLimiter, RateLimitExceeded, get, ping
 
@@ -90,7 +89,7 @@ class Annatar:
         """Scrape the given media item"""
         data, stream_count = self.api_scrape(item)
         if len(data) > 0:
-            item.streams.update(data)
+            item.add_streams(data)
             logger.debug(
                 "Found %s streams out of %s for %s",
                 len(data),
@@ -138,18 +137,12 @@ class Annatar:
                 response = get(url, retry_if_failed=False, timeout=60)
             if not response.is_ok or len(response.data.media) <= 0:
                 return {}, 0
-            torrents = set()
             correct_title = item.get_top_title()
             if not correct_title:
                 return {}, 0
-            for stream in response.data.media:
-                if not stream.hash:
-                    continue
-                with contextlib.suppress(GarbageTorrent):
-                    torrent: Torrent = self.rtn.rank(
-                        raw_title=stream.title, infohash=stream.hash, correct_title=correct_title, remove_trash=True
-                    )
-                if torrent and torrent.fetch:
-                    torrents.add(torrent)
-            scraped_torrents = sort_torrents(torrents)
-            return scraped_torrents, len(response.data.media)
+            titles = [
+                (stream.title, stream.hash)
+                for stream in response.data.media
+                if stream.hash and stream.title
+            ]
+            return rank_streams(self.rtn, titles, correct_title), len(response.data.media)
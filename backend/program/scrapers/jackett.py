@@ -1,13 +1,12 @@
 """ Jackett scraper module """
-import contextlib
 from typing import Dict
 
 from program.media.item import Show
+from program.parsing import rank_torznab
 from program.settings.manager import settings_manager
 from program.settings.versions import models
 from requests import ReadTimeout, RequestException
-from RTN import RTN, Torrent, sort_torrents
-from RTN.exceptions import GarbageTorrent
+from RTN import RTN
 from utils.logger import logger
 from utils.request import RateLimiter, RateLimitExceeded, get, ping
 
@@ -73,7 +72,7 @@ class Jackett:
         """Scrape the given media item"""
         data, stream_count = self.api_scrape(item)
         if len(data) > 0:
-            item.streams.update(data)
+            item.add_streams(data)
             logger.debug(
                 "Found %s streams out of %s for %s",
                 len(data),
@@ -84,7 +83,7 @@ class Jackett:
             logger.debug("Could not find streams for %s", item.log_string)
         return item
 
-    def api_scrape(self, item) -> tuple[Dict, int]:  # noqa: C901
+    def api_scrape(self, item) -> tuple[Dict, int]:
         """Wrapper for `Jackett` scrape method"""
         # https://github.com/Jackett/Jackett/wiki/Jackett-Categories
         with self.minute_limiter:
@@ -102,30 +101,13 @@ class Jackett:
                 query = f"cat=5000&t=tvsearch&q={item.parent.parent.title}&season={item.parent.number}&ep={item.number}"
             url = f"{self.settings.url}/api/v2.0/indexers/all/results/torznab?apikey={self.api_key}&{query}"
             with self.second_limiter:
-                response = get(url=url, retry_if_failed=False, timeout=60)
-            if (
-                not response.is_ok
-                or len(response.data["rss"]["channel"].get("item", [])) <= 0
-            ):
-                return {}, 0
-            streams = response.data["rss"]["channel"].get("item", [])
-            if not streams:
+                # the feed is parsed along with the ranking
+                response = get(
+                    url=url, retry_if_failed=False, timeout=60, response_type=bytes
+                )
+            if not response.is_ok or not response.data:
                 return {}, 0
-            torrents = set()
             correct_title = item.get_top_title()
             if not correct_title:
                 return {}, 0
-            for stream in streams:
-                attr = stream.get("torznab:attr", [])
-                infohash_attr = next((a for a in attr if a.get("@name") == "infohash"), None)
-                infohash = infohash_attr.get("@value")
-                if not infohash:
-                    continue
-                with contextlib.suppress(GarbageTorrent):
-                    torrent: Torrent = self.rtn.rank(
-                        raw_title=stream.get("title"), infohash=infohash, correct_title=correct_title, remove_trash=True
-                    )
-                if torrent and torrent.fetch:
-                    torrents.add(torrent)
-            scraped_torrents = sort_torrents(torrents)
-            return scraped_torrents, len(streams) or 0
+            return rank_torznab(self.rtn, response.data, correct_title)
@@ -1,16 +1,15 @@
 """ Orionoid scraper module """
 
-import contextlib
 from datetime import datetime
 from typing import Dict
 
 from program.media.item import Episode, Season, Show
+from program.parsing import rank_streams
 from program.settings.manager import settings_manager
 from program.settings.versions import models
 from requests import ConnectTimeout
 from requests.exceptions import RequestException
-from RTN import RTN, Torrent, sort_torrents
-from RTN.exceptions import GarbageTorrent
+from RTN import RTN
 from utils.logger import logger
 from utils.request import RateLimiter, RateLimitExceeded, get
 
@@ -121,7 +120,7 @@ class Orionoid:
         """Scrape the given media item"""
         data, stream_count = self.api_scrape(item)
         if len(data) > 0:
-            item.streams.update(data)
+            item.add_streams(data)
             logger.debug(
                 "Found %s streams out of %s for %s",
                 len(data),
@@ -189,18 +188,12 @@ class Orionoid:
                 response = get(url, retry_if_failed=False, timeout=60)
             if not response.is_ok or not hasattr(response.data, "data"):
                 return {}, 0
-            torrents = set()
             correct_title = item.get_top_title()
             if not correct_title:
                 return {}, 0
-            for stream in response.data.data.streams:
-                if not stream.file.hash or not stream.file.name:
-                    continue
-                with contextlib.suppress(GarbageTorrent):
-                    torrent: Torrent = self.rtn.rank(
-                        raw_title=stream.file.name, infohash=stream.file.hash, correct_title=correct_title, remove_trash=True
-                    )
-                if torrent and torrent.fetch:
-                    torrents.add(torrent)
-            scraped_torrents = sort_torrents(torrents)
-            return scraped_torrents, len(response.data.data.streams)
+            titles = [
+                (stream.file.name, stream.file.hash)
+                for stream in response.data.data.streams
+                if stream.file.hash and stream.file.name
+            ]
+            return rank_streams(self.rtn, titles, correct_title), len(response.data.data.streams)
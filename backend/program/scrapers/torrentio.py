@@ -1,17 +1,17 @@
 """ Torrentio scraper module """
 
-import contextlib
+import asyncio
 from typing import Dict
 
 from program.media.item import Episode, Season, Show
+from program.parsing import rank_streams
 from program.settings.manager import settings_manager
 from program.settings.versions import models
 from requests import ConnectTimeout, ReadTimeout
 from requests.exceptions import RequestException
-from RTN import RTN, sort_torrents
-from RTN.exceptions import GarbageTorrent
+from RTN import RTN
 from utils.logger import logger
-from utils.request import RateLimiter, RateLimitExceeded, get, ping
+from utils.request import RateLimiter, RateLimitExceeded, async_get, get, ping
 
 
 class Torrentio:
@@ -56,27 +56,37 @@ class Torrentio:
         if item is None or isinstance(item, Show):
             yield item
         try:
-            yield self._scrape_item(item)
-        except RateLimitExceeded:
-            self.minute_limiter.limit_hit()
-        except ConnectTimeout:
-            self.minute_limiter.limit_hit()
-            logger.warn("Torrentio connection timeout for item: %s", item.log_string)
-        except ReadTimeout:
-            self.minute_limiter.limit_hit()
-            logger.warn("Torrentio read timeout for item: %s", item.log_string)
-        except RequestException as e:
-            self.minute_limiter.limit_hit()
-            logger.warn("Torrentio request exception: %s", e)
-        except Exception as e:
-            self.minute_limiter.limit_hit()
-            logger.warn("Torrentio exception thrown: %s", e)
+            yield self._scrape_item(item, *self.api_scrape(item))
+        except Exception as e:  # noqa: BLE001
+            self._scrape_failed(item, e)
 
-    def _scrape_item(self, item):
-        """Scrape the given media item"""
-        data, stream_count = self.api_scrape(item)
+    async def arun(self, item):
+        """Async counterpart of `run` for the asyncio engine"""
+        if item is None or isinstance(item, Show):
+            yield item
+        try:
+            yield self._scrape_item(item, *await self.async_api_scrape(item))
+        except Exception as e:  # noqa: BLE001
+            self._scrape_failed(item, e)
+
+    def _scrape_failed(self, item, error: Exception):
+        self.minute_limiter.limit_hit()
+        match error:
+            case RateLimitExceeded():
+                pass
+            case ConnectTimeout():
+                logger.warn("Torrentio connection timeout for item: %s", item.log_string)
+            case ReadTimeout():
+                logger.warn("Torrentio read timeout for item: %s", item.log_string)
+            case RequestException():
+                logger.warn("Torrentio request exception: %s", error)
+            case _:
+                logger.warn("Torrentio exception thrown: %s", error)
+
+    def _scrape_item(self, item, data: Dict, stream_count: int):
+        """Add the scraped streams to the given media item"""
         if len(data) > 0:
-            item.streams.update(data)
+            item.add_streams(data)
             logger.debug(
                 "Found %s streams out of %s for %s",
                 len(data),
@@ -96,42 +106,51 @@ class Torrentio:
     def api_scrape(self, item) -> tuple[Dict, int]:
         """Wrapper for `Torrentio` scrape method"""
         with self.minute_limiter:
-            if isinstance(item, Season):
-                identifier = f":{item.number}:1"
-                scrape_type = "series"
-                imdb_id = item.parent.imdb_id
-            elif isinstance(item, Episode):
-                identifier = f":{item.parent.number}:{item.number}"
-                scrape_type = "series"
-                imdb_id = item.parent.parent.imdb_id
-            else:
-                identifier = None
-                scrape_type = "movie"
-                imdb_id = item.imdb_id
-
-            url = (
-                f"{self.settings.url}/{self.settings.filter}"
-                + f"/stream/{scrape_type}/{imdb_id}"
-            )
-            if identifier:
-                url += identifier
+            url = self._scrape_url(item)
             with self.second_limiter:
-                response = get(f"{url}.json", retry_if_failed=False, timeout=60)
-            if not response.is_ok or len(response.data.streams) <= 0:
-                return {}, 0
-            torrents = set()
-            correct_title = item.get_top_title()
-            if not correct_title:
-                return {}, 0
-            for stream in response.data.streams:
-                raw_title: str = stream.title.split("\n👤")[0].split("\n")[0]
-                if not stream.infoHash or not raw_title:
-                    continue
-                with contextlib.suppress(GarbageTorrent):
-                    torrent = self.rtn.rank(
-                        raw_title=raw_title, infohash=stream.infoHash, correct_title=correct_title, remove_trash=True
-                    )
-                if torrent and torrent.fetch:
-                    torrents.add(torrent)
-            scraped_torrents = sort_torrents(torrents)
-            return scraped_torrents, len(response.data.streams)
+                response = get(url, retry_if_failed=False, timeout=60)
+            return self._rank_streams(item, response)
+
+    async def async_api_scrape(self, item) -> tuple[Dict, int]:
+        """Async counterpart of `api_scrape`, ranking runs in a thread so it
+        doesn't hold up the event loop"""
+        async with self.minute_limiter:
+            url = self._scrape_url(item)
+            async with self.second_limiter:
+                response = await async_get(url, timeout=60)
+            return await asyncio.to_thread(self._rank_streams, item, response)
+
+    def _scrape_url(self, item) -> str:
+        if isinstance(item, Season):
+            identifier = f":{item.number}:1"
+            scrape_type = "series"
+            imdb_id = item.parent.imdb_id
+        elif isinstance(item, Episode):
+            identifier = f":{item.parent.number}:{item.number}"
+            scrape_type = "series"
+            imdb_id = item.parent.parent.imdb_id
+        else:
+            identifier = None
+            scrape_type = "movie"
+            imdb_id = item.imdb_id
+
+        url = (
+            f"{self.settings.url}/{self.settings.filter}"
+            + f"/stream/{scrape_type}/{imdb_id}"
+        )
+        if identifier:
+            url += identifier
+        return f"{url}.json"
+
+    def _rank_streams(self, item, response) -> tuple[Dict, int]:
+        if not response.is_ok or len(response.data.streams) <= 0:
+            return {}, 0
+        correct_title = item.get_top_title()
+        if not correct_title:
+            return {}, 0
+        titles = []
+        for stream in response.data.streams:
+            raw_title: str = stream.title.split("\n👤")[0].split("\n")[0]
+            if stream.infoHash and raw_title:
+                titles.append((raw_title, stream.infoHash))
+        return rank_streams(self.rtn, titles, correct_title), len(response.data.streams)
@@ -1,6 +1,6 @@
 """Iceberg settings models"""
 from pathlib import Path
-from typing import Callable, Dict
+from typing import Callable, Dict, Literal
 
 from pydantic import BaseModel, field_validator
 from RTN.models import CustomRank, SettingsModel
@@ -118,6 +118,8 @@ class ScraperModel(Observable):
     after_2: float = 2
     after_5: int = 6
     after_10: int = 24
+    # best ranked streams kept per item
+    max_streams: int = 30
     jackett: JackettConfig = JackettConfig()
     orionoid: OrionoidConfig = OrionoidConfig()
     torrentio: TorrentioConfig = TorrentioConfig()
@@ -163,6 +165,49 @@ class IndexerModel(Observable):
     update_interval: int = 60 * 60
 
 
+class StorageModel(Observable):
+    backend: Literal["pickle", "sqlite"] = "pickle"
+    journal_compaction_mb: int = 16
+    # move completed movies and shows out of memory, see MediaItemContainer
+    cold_tier: bool = True
+
+
+class PipelineModel(Observable):
+    # priority class of the events emitted by each service, services that
+    # aren't listed emit "progress" events
+    priorities: Dict[str, Literal["request", "content", "progress", "retry"]] = {
+        "Overseerr": "request",
+        "PlexWatchlist": "request",
+        "Listrr": "content",
+        "Mdblist": "content",
+        "SymlinkLibrary": "content",
+        "Program": "retry",
+    }
+    # worker threads of each service, services that aren't listed get one
+    workers: Dict[str, int] = {
+        "TraktIndexer": 4,
+        "Scraping": 8,
+        "Debrid": 2,
+        "Symlinker": 2,
+        "PlexUpdater": 2,
+    }
+    # "asyncio" runs the services that have an async `arun` on the server's
+    # event loop instead of their thread pool, it needs httpx installed
+    engine: Literal["threads", "asyncio"] = "threads"
+    # coroutines of each service running at once with the asyncio engine
+    async_concurrency: int = 256
+    # worker processes that parse and rank scraped titles, 0 parses them in
+    # the scraping threads
+    processes: int = 0
+    # queued events at which the content services wait for the pipeline to
+    # catch up, and at which due retries are put off
+    queue_size: int = 1000
+    retry_queue_size: int = 200
+    # jobs of each service waiting for a worker before new jobs are deferred,
+    # with as many deferred the pipeline stops taking events
+    stage_queue_size: int = 100
+
+
 def get_version() -> str:
     with open(version_file_path.resolve()) as file:
         return file.read()
@@ -179,3 +224,5 @@ class AppModel(Observable):
     scraping: ScraperModel = ScraperModel()
     ranking: RTNSettingsModel = RTNSettingsModel()
     indexer: IndexerModel = IndexerModel()
+    storage: StorageModel = StorageModel()
+    pipeline: PipelineModel = PipelineModel()
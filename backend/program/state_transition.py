@@ -9,6 +9,9 @@ from program.types import ProcessedEvent, Service
 from program.updaters.plex import PlexUpdater
 from utils.logger import logger
 
+# services that request items, their items are indexed before anything else
+SOURCE_SERVICES = (Overseerr, PlexWatchlist, Listrr, Mdblist, SymlinkLibrary)
+
 
 def process_event(existing_item: MediaItem | None, emitted_by: Service, item: MediaItem) -> ProcessedEvent:  # type: ignore
     """Take the input event, process it, and output items to submit to a Service, and an item
@@ -18,8 +21,7 @@ def process_event(existing_item: MediaItem | None, emitted_by: Service, item: Me
     no_further_processing: ProcessedEvent = (None, None, [])  # type: ignore
     # we always want to get metadata for content items before we compare to the container.
     # we can't just check if the show exists we have to check if it's complete
-    source_services = (Overseerr, PlexWatchlist, Listrr, Mdblist, SymlinkLibrary)
-    if emitted_by in source_services or item.state == States.Unknown:
+    if emitted_by in SOURCE_SERVICES or item.state in (States.Unknown, States.Requested):
         next_service = TraktIndexer
         # seasons can't be indexed so we'll index and process the show instead
         if isinstance(item, Season):
@@ -35,6 +37,9 @@ def process_event(existing_item: MediaItem | None, emitted_by: Service, item: Me
         next_service = Scraping
         if existing_item:
             if not existing_item.indexed_at:
+                # the container's item is a shared snapshot, take a private
+                # copy before merging into it
+                existing_item = existing_item.copy()
                 # merge our fresh metadata item to make sure there aren't any
                 # missing seasons or episodes in our library copy
                 if isinstance(item, (Show, Season)):
@@ -6,6 +6,7 @@ from datetime import datetime
 from pathlib import Path
 
 from program.media.item import Episode, Movie
+from program.media.patch import MarkSymlinked
 from program.settings.manager import settings_manager
 from utils.logger import logger
 from watchdog.events import FileSystemEventHandler
@@ -170,9 +171,13 @@ class Symlinker:
                 item.log_string,
                 rclone_path,
             )
-        item.symlinked_at = datetime.now()
-        item.symlinked_times += 1
-        yield item
+        yield MarkSymlinked(
+            item.item_id,
+            symlinked=item.symlinked,
+            symlinked_at=datetime.now(),
+            folder=item.folder,
+            update_folder=item.update_folder,
+        )
 
     @staticmethod
     def should_submit(item):
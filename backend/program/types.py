@@ -3,7 +3,8 @@ from typing import Generator, Union
 
 from program.content import Listrr, Mdblist, Overseerr, PlexWatchlist
 from program.libaries import SymlinkLibrary
-from program.media.item import MediaItem
+from program.media.item import ItemId, MediaItem
+from program.media.patch import ItemPatch
 from program.realdebrid import Debrid
 from program.scrapers import Jackett, Orionoid, Scraping, Torrentio
 from program.symlink import Symlinker
@@ -19,4 +20,9 @@ ProcessedEvent = (MediaItem, Service, list[MediaItem])
 @dataclass
 class Event:
     emitted_by: Service
-    item: MediaItem
+    item: MediaItem | None = None
+    patch: ItemPatch | None = None
+
+    @property
+    def item_id(self) -> ItemId:
+        return self.patch.item_id if self.patch is not None else self.item.item_id
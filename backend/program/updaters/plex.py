@@ -5,6 +5,7 @@ import os
 from plexapi.exceptions import BadRequest, Unauthorized
 from plexapi.server import PlexServer
 from program.media.item import Episode
+from program.media.patch import SetFields
 from program.settings.manager import settings_manager
 from utils.logger import logger
 
@@ -41,7 +42,7 @@ class PlexUpdater:
                 logger.debug(
                     "Updated section %s for %s", section.title, item.log_string
                 )
-        yield item
+        yield SetFields(item.item_id, {"update_folder": item.update_folder})
 
     def _update_section(self, section, item):
         if item.symlinked and item.get("update_folder") != "updated":
@@ -0,0 +1,27 @@
+import threading
+from argparse import Namespace
+
+import pytest
+from program.event_queue import EventQueue
+from program.media.container import MediaItemContainer
+from program.program import Program
+from program.retry import RetryScheduler
+
+
+@pytest.fixture
+def program():
+    """A Program with the pipeline state `Program.start` sets up, without its
+    thread, services and storage. Tests add the services and executors they use."""
+    program = Program.__new__(Program)
+    program.startup_args = Namespace(profile_state_transitions=False)
+    program.media_items = MediaItemContainer()
+    program.event_queue = EventQueue()
+    program.services = {}
+    program.executors = {}
+    program._in_flight = set()  # noqa: SLF001
+    program._in_flight_lock = threading.Lock()  # noqa: SLF001
+    program.retries = RetryScheduler()
+    program._retry_generation = None  # noqa: SLF001
+    yield program
+    for executor in program.executors.values():
+        executor.shutdown(wait=True)
@@ -1,6 +1,12 @@
+import threading
+from datetime import datetime
+
 import pytest
 from program.media.container import MediaItemContainer
-from program.media.item import Episode, Season, Show
+from program.media.item import Episode, ItemId, Movie, Season, Show
+from program.media.patch import AddStreams, MarkSymlinked, SetFields
+from program.media.state import States
+from program.media.stream import Stream
 
 
 @pytest.fixture
@@ -27,7 +33,7 @@ def test_upsert_episode_modification_reflects_in_parent_season(container, test_s
 
     # Modify an attribute of the copied episode
     modified_attribute_value = "Modified Value"
-    modified_episode.some_attribute = modified_attribute_value
+    modified_episode.folder = modified_attribute_value
 
     # Upsert the modified episode
     container.upsert(modified_episode)
@@ -37,10 +43,10 @@ def test_upsert_episode_modification_reflects_in_parent_season(container, test_s
     container_episode = container._items[modified_episode.item_id]
 
     # Verify that the modified episode's attribute is updated in the container
-    assert container_episode.some_attribute == modified_attribute_value
+    assert container_episode.folder == modified_attribute_value
     # Verify that the season in the container now points to the updated episode
     assert (
-        container_season.episodes[container_episode.number - 1].some_attribute
+        container_season.episodes[container_episode.number - 1].folder
         == modified_attribute_value
     )
 
@@ -52,7 +58,7 @@ def test_upsert_season_modification_reflects_in_parent_show(container, test_show
 
     # Modify an attribute of the season
     modified_attribute_value = "Modified Season Attribute"
-    modified_season.some_attribute = modified_attribute_value
+    modified_season.folder = modified_attribute_value
 
     # Upsert the modified season
     container.upsert(modified_season)
@@ -63,9 +69,228 @@ def test_upsert_season_modification_reflects_in_parent_show(container, test_show
     container_season = container._items[modified_season.item_id]
 
     # Verify that the modified season's attribute is updated in the container
-    assert container_season.some_attribute == modified_attribute_value
+    assert container_season.folder == modified_attribute_value
     # Verify that the show in the container now references the updated season
     assert (
-        container_show.seasons[container_season.number - 1].some_attribute
+        container_show.seasons[container_season.number - 1].folder
         == modified_attribute_value
     )
+
+
+def test_reads_share_items_and_upsert_copies_input(container, test_show):
+    container.upsert(test_show)
+    episode = test_show.seasons[0].episodes[0]
+
+    # Reads hand out the stored snapshot instead of copying it
+    assert container.get(episode.item_id) is container[episode.item_id]
+    assert container[episode.item_id] is not episode
+
+    # Modifying the input after the upsert doesn't leak into the container
+    episode.file = "episode.mkv"
+    assert container[episode.item_id].file is None
+
+    # The stored episode is linked to the stored season
+    container_season = container[episode.item_id.parent_id]
+    assert container[episode.item_id].parent is container_season
+    assert container_season.parent is container[test_show.item_id]
+
+
+def test_copy_shares_parents_and_copies_children(test_show):
+    season = test_show.seasons[0]
+    season.streams["hash"] = "torrent"
+
+    season_copy = season.copy()
+    season_copy.streams["other"] = "torrent"
+    season_copy.episodes[0].file = "episode.mkv"
+
+    assert season_copy.parent is test_show
+    assert season_copy.episodes[0].parent is season_copy
+    assert "other" not in season.streams
+    assert season.episodes[0].file is None
+
+
+def test_indexes_follow_upserts_and_removals(container, test_show):
+    test_show.requested_by = Show
+    container.upsert(test_show)
+    episode = test_show.seasons[0].episodes[0]
+
+    assert container.get_item_by_imdb_id("tt1405406").item_id == test_show.item_id
+    assert container.get_item_by_id("tt1405406/1/1").item_id == episode.item_id
+    assert list(container.get_items_requested_by(Show)) == [test_show.item_id]
+    assert container.count(States.Unknown) == 3
+    assert len(container.get_incomplete_items()) == 3
+
+    # Completing the only episode completes the season and show as well
+    episode.key = "plex-key"
+    container.upsert(episode)
+    assert container.count(States.Completed) == 3
+    assert container.get_incomplete_items() == {}
+
+    container.remove("tt1405406")
+    assert len(container) == 0
+    assert container.count(States.Completed) == 0
+    assert container.get_item_by_imdb_id("tt1405406") is None
+
+
+def test_upsert_links_children_to_their_parent_by_id(container, test_show):
+    container.upsert(test_show)
+    episode = test_show.seasons[0].episodes[0].copy()
+    episode.parent = None
+    episode.file = "episode.mkv"
+
+    container.upsert(episode)
+
+    container_season = container[episode.item_id.parent_id]
+    assert container[episode.item_id].parent is container_season
+    assert container_season.get_episode(1).file == "episode.mkv"
+
+
+def test_apply_patches_to_stored_items(container, test_show):
+    container.upsert(test_show)
+    season = test_show.seasons[0]
+    episode = season.episodes[0]
+
+    stream = Stream("hash", "Show.S01E01.1080p", 90, "Show", ("1080p",), (1,), (1,))
+    patched = container.apply(
+        AddStreams(episode.item_id, streams={"hash": stream}, scraped_at=datetime.now())
+    )
+    assert patched is container[episode.item_id]
+    assert patched.streams == {"hash": stream}
+    assert patched.scraped_times == 1
+    # the input item is not modified
+    assert episode.streams == {}
+
+    container.apply(
+        SetFields(
+            season.item_id,
+            {"active_stream": {"hash": "hash"}},
+            children=(SetFields(episode.item_id, {"file": "e.mkv", "folder": "f"}),),
+        )
+    )
+    assert container[season.item_id].active_stream == {"hash": "hash"}
+    assert container[episode.item_id].file == "e.mkv"
+    assert container.count(States.Downloaded) == 3
+
+    container.apply(
+        MarkSymlinked(
+            episode.item_id,
+            symlinked=True,
+            symlinked_at=datetime.now(),
+            folder="f",
+            update_folder="season folder",
+        )
+    )
+    assert container[episode.item_id].symlinked_times == 1
+    assert container[test_show.item_id].state == States.Symlinked
+
+    assert container.apply(SetFields(ItemId("tt0000000"), {"title": "x"})) is None
+
+
+class _RecordingStore:
+    def __init__(self):
+        self.writes = []
+
+    def upsert(self, item):
+        self.writes.append([item.item_id])
+
+    def upsert_many(self, items):
+        self.writes.append([item.item_id for item in items])
+
+    def remove(self, item):
+        self.writes.append(("remove", item.item_id))
+
+
+def test_batch_writes_changed_children_as_their_parent(container):
+    show = Show({"imdb_id": "tt1405406"})
+    for season_number in (1, 2):
+        season = Season({"number": season_number})
+        for number in (1, 2, 3):
+            season.add_episode(Episode({"number": number}))
+        show.add_season(season)
+    container.upsert(show)
+    container.store = store = _RecordingStore()
+
+    first_season, second_season = show.seasons
+    with container.batch():
+        for episode in first_season.episodes:
+            episode.file = "episode.mkv"
+            container.upsert(episode)
+        container.upsert(second_season.episodes[0])
+
+    assert store.writes == [[first_season.item_id, second_season.episodes[0].item_id]]
+    assert container[first_season.episodes[2].item_id].file == "episode.mkv"
+
+    store.writes.clear()
+    container.upsert_many([show, first_season.episodes[0]])
+    assert store.writes == [[show.item_id]]
+
+
+def test_change_log_is_bounded():
+    container = MediaItemContainer(change_log_size=2)
+    show = Show({"imdb_id": "tt1405406"})
+    container.upsert(show)
+    assert [change.item_id for change in container.changes_since(0)] == [show.item_id]
+
+    season = Season({"number": 1})
+    show.add_season(season)
+    container.upsert(season)
+    container.upsert(season)
+    assert container.changes_since(0) is None
+    assert [change.generation for change in container.changes_since(2)] == [3, 3]
+    assert container.changes_since(3) == []
+
+
+def test_readers_see_whole_batches_while_items_change(container):
+    errors = []
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                # movies are added and removed in pairs
+                assert len(list(container)) % 2 == 0
+                assert len(container.get_items_with_state(States.Requested)) % 2 == 0
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for number in range(500):
+            pair = [Movie({"imdb_id": f"tt{number}{side}"}) for side in "ab"]
+            with container.batch():
+                for movie in pair:
+                    container.upsert(movie)
+            if number % 3 == 0:
+                with container.batch():
+                    for movie in pair:
+                        container.remove(movie)
+    finally:
+        done.set()
+        reader.join()
+    assert not errors
+
+
+def test_upserts_leave_the_parents_readers_hold_unchanged(container, test_show):
+    test_show.seasons[0].add_episode(Episode({"number": 2}))
+    container.upsert(test_show)
+    season = container[test_show.seasons[0].item_id]
+    show = container[test_show.item_id]
+    episodes = list(season.episodes)
+
+    episode = season.episodes[0].copy()
+    episode.key = "plex-key"
+    container.upsert(episode)
+    container.remove(season.episodes[1].item_id)
+
+    # the held snapshots still show the library as it was
+    assert season.episodes == episodes
+    assert season.state == States.Unknown
+    assert show.seasons[0] is season
+    # the container holds copies of the parents with the changes
+    stored_season = container[season.item_id]
+    assert stored_season is not season
+    assert [e.number for e in stored_season.episodes] == [1]
+    assert stored_season.episodes[0].parent is stored_season
+    assert stored_season.parent is container[show.item_id]
+    assert container[show.item_id].state == States.Completed
@@ -0,0 +1,186 @@
+import threading
+from queue import Full
+from types import SimpleNamespace
+
+import pytest
+from program.content import Mdblist, Overseerr
+from program.event_queue import EventQueue
+from program.executors import ServiceExecutor
+from program.indexers import trakt
+from program.media.item import Movie, Show
+from program.media.patch import SetFields
+from program.program import Program
+from program.scrapers import Scraping
+from program.types import Event
+
+
+def _event(emitted_by, imdb_id, requested_by=None):
+    return Event(
+        emitted_by=emitted_by,
+        item=Movie({"imdb_id": imdb_id, "requested_by": requested_by}),
+    )
+
+
+def test_events_are_handed_out_by_priority_class():
+    queue = EventQueue()
+    queue.put(_event(Program, "tt1", requested_by=Overseerr))
+    queue.put(_event(Scraping, "tt2", requested_by=Mdblist))
+    queue.put(_event(Mdblist, "tt3", requested_by=Mdblist))
+    queue.put(_event(Scraping, "tt4", requested_by=Overseerr))
+    queue.put(_event(Overseerr, "tt5", requested_by=Overseerr))
+
+    assert queue.depths() == {"request": 2, "content": 2, "progress": 0, "retry": 1}
+    order = [queue.get_nowait().item.imdb_id for _ in range(5)]
+    # items keep the class of their requester, retries don't
+    assert order == ["tt4", "tt5", "tt2", "tt3", "tt1"]
+    assert queue.depths()["retry"] == 0
+
+
+def test_requests_keep_their_class_through_indexing(monkeypatch, program):
+    episode = SimpleNamespace(number=1, title="Pilot", ids=SimpleNamespace())
+    season = SimpleNamespace(number=1, title="Season 1", ids=SimpleNamespace(), episodes=[episode])
+    monkeypatch.setattr(
+        trakt,
+        "create_item_from_imdb_id",
+        lambda imdb_id: Show({"imdb_id": imdb_id, "title": "Show"}),
+    )
+    monkeypatch.setattr(trakt, "get_show", lambda _imdb_id: [season])
+
+    requested = Show({"imdb_id": "tt1", "requested_by": Overseerr})
+    (indexed,) = trakt.TraktIndexer().run(requested)
+    program._process_event(Event(emitted_by=trakt.TraktIndexer, item=indexed))  # noqa: SLF001
+    show = program.media_items.get(requested.item_id)
+    assert show.requested_by is Overseerr
+
+    queue = EventQueue()
+    queue.put(_event(Mdblist, "tt2", requested_by=Mdblist))
+    # the episodes of the show are processed with the class of its request
+    episode = show.seasons[0].episodes[0]
+    queue.put(Event(emitted_by=Scraping, item=episode))
+    assert queue.depths()["request"] == 1
+    assert queue.get_nowait().item is episode
+
+
+def test_item_events_are_coalesced_and_patches_are_not():
+    queue = EventQueue()
+    first, second = _event(Scraping, "tt1"), _event(Scraping, "tt1")
+    queue.put(first)
+    queue.put(_event(Scraping, "tt2"))
+    queue.put(second)
+    patch = Event(emitted_by=Scraping, patch=SetFields(first.item_id, {"title": "x"}))
+    queue.put(patch)
+    queue.put(patch)
+
+    assert queue.coalesced == 1
+    assert queue.unfinished_tasks == 4
+    assert queue.get_nowait() is second
+    assert queue.get_nowait().item.imdb_id == "tt2"
+    assert queue.get_nowait() is patch
+    assert queue.get_nowait() is patch
+    # taken events are no longer coalesced with
+    queue.put(first)
+    assert queue.get_nowait() is first
+
+
+def test_coalesced_events_take_the_higher_class():
+    queue = EventQueue()
+    queue.put(_event(Scraping, "tt1"))
+    queue.put(_event(Mdblist, "tt2", requested_by=Mdblist))
+    queue.put(_event(Scraping, "tt1", requested_by=Overseerr))
+
+    assert queue.depths() == {"request": 1, "content": 1, "progress": 0, "retry": 0}
+    assert queue.get_nowait().item.imdb_id == "tt1"
+    queue.task_done()
+    assert queue.get_nowait().item.imdb_id == "tt2"
+    queue.task_done()
+    # the coalesced event was never a task of its own
+    queue.join()
+
+
+def test_sources_are_held_back_and_retries_shed_first():
+    queue = EventQueue(maxsize=3, retry_limit=1)
+    assert queue.put(_event(Program, "tt1"))
+    assert not queue.put(_event(Program, "tt2"))
+    queue.put(_event(Mdblist, "tt3"))
+    queue.put(_event(Overseerr, "tt4"))
+    with pytest.raises(Full):
+        queue.put(_event(Mdblist, "tt5"), timeout=0.01)
+    # the pipeline's own events are never held back
+    queue.put(_event(Scraping, "tt6"))
+
+    assert queue.stats() == {
+        "request": 1,
+        "content": 1,
+        "progress": 1,
+        "retry": 1,
+        "coalesced": 0,
+        "shed": 1,
+        "high_water": 4,
+    }
+    blocked = threading.Thread(target=queue.put, args=(_event(Mdblist, "tt5"),))
+    blocked.start()
+    queue.get_nowait()
+    queue.get_nowait()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    assert queue.qsize() == 3
+
+
+def test_jobs_are_not_submitted_twice_while_running(program):
+    release = threading.Event()
+    runs = []
+
+    class SlowService:
+        def run(self, item):
+            runs.append(item.item_id)
+            release.wait(5)
+            yield SetFields(item.item_id, {"title": "done"})
+
+    program.services[SlowService] = SlowService()
+    program.executors[SlowService] = ServiceExecutor(SlowService, 2)
+    item = Movie({"imdb_id": "tt1"})
+
+    program._submit_job(SlowService, item)  # noqa: SLF001
+    program._submit_job(SlowService, item.copy())  # noqa: SLF001
+    assert program.executors[SlowService].stats() == {
+        "workers": 2,
+        "running": 1,
+        "queued": 0,
+        "deferred": 0,
+        "high_water": 0,
+    }
+    release.set()
+    program.executors[SlowService].shutdown(wait=True)
+    program.executors[SlowService] = ServiceExecutor(SlowService, 1)
+
+    assert runs == [item.item_id]
+    assert program.event_queue.qsize() == 1
+    # once the job is done the item can be submitted again
+    program._submit_job(SlowService, item)  # noqa: SLF001
+    program.executors[SlowService].shutdown(wait=True)
+    assert len(runs) == 2
+
+
+def test_no_events_are_taken_while_a_stage_is_full(program):
+    release = threading.Event()
+
+    def job():
+        release.wait(5)
+        yield from ()
+
+    executor = program.executors[Scraping] = ServiceExecutor(Scraping, 1, max_queued=1)
+    for number in range(3):
+        program.event_queue.put(_event(Scraping, f"tt{number}"))
+        executor.submit(job)
+    # a stage takes as many jobs again as it runs and queues, before it waits
+    assert program._stage_room() == 1  # noqa: SLF001
+    assert len(program._next_events(program._stage_room())) == 1  # noqa: SLF001
+
+    executor.submit(job)
+    assert program._next_events(program._stage_room()) == []  # noqa: SLF001
+    assert program.event_queue.qsize() == 2
+
+    release.set()
+    executor.shutdown(wait=True)
+    assert program._stage_room() == 4  # noqa: SLF001
+    assert len(program._next_events(program._stage_room())) == 2  # noqa: SLF001
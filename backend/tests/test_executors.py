@@ -0,0 +1,113 @@
+import asyncio
+import threading
+
+from program.executors import CoroutineExecutor, ServiceExecutor
+from program.media.item import Movie
+from program.media.patch import SetFields
+from program.scrapers import Scraping
+
+
+def test_a_full_stage_defers_jobs_without_blocking():
+    release = threading.Event()
+
+    def job(number):
+        release.wait(5)
+        yield number
+
+    executor = ServiceExecutor(Scraping, 1, max_queued=1)
+    futures = [executor.submit(job, number) for number in range(4)]
+    assert executor.stats() == {
+        "workers": 1,
+        "running": 1,
+        "queued": 1,
+        "deferred": 2,
+        "high_water": 3,
+    }
+    release.set()
+    assert [future.result(5) for future in futures] == [[0], [1], [2], [3]]
+    assert executor.stats()["deferred"] == 0
+
+    # jobs that are still deferred are cancelled on shutdown
+    release.clear()
+    running = executor.submit(job, 4)
+    queued = executor.submit(job, 5)
+    deferred = executor.submit(job, 6)
+    threading.Timer(0.1, release.set).start()
+    executor.shutdown(wait=True)
+    assert running.result() == [4]
+    assert queued.result() == [5]
+    assert deferred.cancelled()
+
+
+def test_submitting_waits_once_a_full_stage_deferred_as_many_jobs():
+    release = threading.Event()
+
+    def job(number):
+        release.wait(5)
+        yield number
+
+    executor = ServiceExecutor(Scraping, 1, max_queued=1)
+    futures = [executor.submit(job, number) for number in range(4)]
+    assert executor.room() == 0
+    submitter = threading.Thread(
+        target=lambda: futures.extend(executor.submit(job, number) for number in range(4, 10))
+    )
+    submitter.start()
+    submitter.join(0.2)
+    assert submitter.is_alive()
+    assert executor.stats()["deferred"] == 2
+
+    release.set()
+    submitter.join(5)
+    assert [future.result(5) for future in futures] == [[number] for number in range(10)]
+    assert executor.stats()["high_water"] == 3
+    assert executor.room() == 4
+
+    # a submit waiting for room is cancelled on shutdown
+    release.clear()
+    futures = [executor.submit(job, number) for number in range(4)]
+    waiting = []
+    submitter = threading.Thread(target=lambda: waiting.append(executor.submit(job, 4)))
+    submitter.start()
+    threading.Timer(0.1, release.set).start()
+    executor.shutdown(wait=True)
+    submitter.join(5)
+    assert waiting[0].cancelled()
+
+
+def test_coroutine_jobs_share_an_event_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    running = []
+
+    class AsyncService:
+        async def arun(self, item):
+            running.append(item)
+            await asyncio.sleep(0.05)
+            yield SetFields(item.item_id, {"title": "done"})
+            running.remove(item)
+
+    executor = CoroutineExecutor(AsyncService, loop, limit=10)
+    try:
+        items = [Movie({"imdb_id": f"tt{number}"}) for number in range(30)]
+        futures = [executor.submit(AsyncService().arun, item) for item in items]
+        stats = executor.stats()
+        executor.shutdown(wait=True)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    assert stats["workers"] == 10
+    assert stats["running"] + stats["queued"] == 30
+    assert [future.result()[0].item_id for future in futures] == [
+        item.item_id for item in items
+    ]
+    assert executor.stats() == {
+        "workers": 10,
+        "running": 0,
+        "queued": 0,
+        "deferred": 0,
+        "high_water": 20,
+    }
@@ -3,6 +3,7 @@ from unittest.mock import MagicMock
 from controllers import items
 from fastapi import FastAPI
 from program.media.container import MediaItemContainer
+from program.media.item import Movie
 from program.media.state import States
 from starlette.testclient import TestClient
 
@@ -29,3 +30,27 @@ def test_get_items():
     assert isinstance(response.json(), dict)
     assert response.json()["success"] is True
     assert isinstance(response.json()["items"], list)
+
+
+def test_get_unknown_imdb_id():
+    response = client.get("/items/imdb/tt0000000")
+    assert response.status_code == 404
+
+
+def test_get_changes_since_generation():
+    media_items = app.program.media_items
+    media_items.upsert(Movie({"imdb_id": "tt0111161", "title": "Shawshank"}))
+    generation = media_items.generation
+    media_items.remove("tt0111161")
+
+    response = client.get("/items/changes", params={"since": generation})
+    assert response.status_code == 200
+    assert response.json()["generation"] == generation + 1
+    assert response.json()["changes"] == [
+        {
+            "generation": generation + 1,
+            "item_id": "tt0111161",
+            "old_state": States.Indexed.value,
+            "new_state": None,
+        }
+    ]
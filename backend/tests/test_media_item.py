@@ -0,0 +1,165 @@
+import json
+import pickle
+from copy import copy
+
+import pytest
+from program.media.item import Episode, ItemId, Movie, Season, Show
+from program.media.state import States
+from program.media.stream import Stream
+from RTN import Torrent, parse
+
+
+def _torrent(title, rank, infohash):
+    return Torrent(
+        raw_title=title, infohash=infohash, data=parse(title), rank=rank, lev_ratio=1
+    )
+
+
+def test_items_are_slotted_and_share_strings():
+    # decoded api payloads hold a fresh string object per item
+    payload = '{"imdb_id": "tt1405406", "network": "HBO", "genres": ["drama"]}'
+    first = Show(json.loads(payload))
+    second = Show(json.loads(payload))
+
+    assert first.network is second.network
+    assert first.genres is second.genres
+    assert first.imdb_link == "https://www.imdb.com/title/tt1405406/"
+    assert not hasattr(first, "__dict__")
+    with pytest.raises(AttributeError):
+        first.not_an_attribute = True
+
+
+def test_items_copy_and_pickle_by_slots():
+    episode = Episode({"number": 3, "title": "Episode"})
+    episode.file = "episode.mkv"
+
+    assert copy(episode).file == "episode.mkv"
+    restored = pickle.loads(pickle.dumps(episode))  # noqa: S301
+    assert restored.title == "Episode"
+    assert restored.number == 3
+    assert restored.folder is None
+
+
+def test_items_restore_state_pickled_before_slots():
+    original = Movie({"imdb_id": "tt0111161", "title": "The Shawshank Redemption"})
+    # items used to pickle their __dict__, including the derived attributes
+    state = {attr: getattr(original, attr) for attr in original}
+    state.update(imdb_link="https://www.imdb.com/title/tt0111161/", type="movie")
+
+    movie = Movie.__new__(Movie)
+    movie.__setstate__(state)
+
+    assert movie.title == "The Shawshank Redemption"
+    assert movie.imdb_link == "https://www.imdb.com/title/tt0111161/"
+    assert movie.type == "movie"
+    assert movie.state == original.state
+
+
+def test_item_ids_are_interned_and_immutable():
+    show = Show({"imdb_id": "tt1405406"})
+    season = Season({"number": 1})
+    season.add_episode(Episode({"number": 2}))
+    show.add_season(season)
+    episode_id = season.episodes[0].item_id
+
+    assert episode_id is ItemId(2, ItemId(1, ItemId("tt1405406")))
+    assert episode_id.parent_id is season.item_id
+    assert str(episode_id) == "tt1405406/1/2"
+    assert pickle.loads(pickle.dumps(episode_id)) is episode_id  # noqa: S301
+    with pytest.raises(AttributeError):
+        episode_id.parent_id = None
+
+    # ids unpickled from old snapshots are equal to interned ones
+    legacy = ItemId.__new__(ItemId)
+    legacy.__setstate__({"value": 2, "parent_id": season.item_id})
+    assert legacy == episode_id
+    assert hash(legacy) == hash(episode_id)
+
+
+def test_show_and_season_states_follow_their_children():
+    show = Show({"imdb_id": "tt1405406", "title": "Show"})
+    season = Season({"number": 1})
+    for number in (1, 2):
+        season.add_episode(Episode({"number": number, "title": "Episode"}))
+    show.add_season(season)
+    first, second = season.episodes
+
+    assert season.state == States.Indexed
+    first.add_streams({"hash": _torrent("Show.S01E01.1080p", 90, "a" * 40)})
+    assert first.state == States.Scraped
+    for episode in (first, second):
+        episode.file, episode.folder = "episode.mkv", "folder"
+    assert season.state == States.Downloaded
+    assert show.state == States.Downloaded
+
+    # modifying a copy leaves the original show alone
+    first.copy().key = "plex-key"
+    assert show.state == States.Downloaded
+
+    first.key = "plex-key"
+    assert season.state == States.PartiallyCompleted
+    assert show.state == States.PartiallyCompleted
+    second.update_folder = "updated"
+    assert season.state == States.Completed
+    assert show.state == States.Completed
+
+
+def test_children_are_kept_ordered_by_number():
+    season = Season({"number": 1})
+    for number in (3, 1, 2):
+        season.add_episode(Episode({"number": number}))
+    replacement = Episode({"number": 2, "title": "Replacement"})
+    season.add_episode(replacement)
+
+    assert [episode.number for episode in season.episodes] == [1, 2, 3]
+    assert season.get_episode(2) is replacement
+    assert season.get_episode(4) is None
+    assert season.get_episode_index_by_id(replacement.item_id) == 1
+
+    indexed = Season({"number": 1})
+    for number in (2, 4):
+        indexed.add_episode(Episode({"number": number, "title": "Indexed"}))
+    season.fill_in_missing_children(indexed)
+
+    assert [episode.number for episode in season.episodes] == [1, 2, 3, 4]
+    assert season.get_episode(2) is replacement
+    assert season.get_episode(4).parent is season
+
+
+def test_pickled_children_reference_their_parent_by_id():
+    show = Show({"imdb_id": "tt1405406", "title": "Show"})
+    season = Season({"number": 1})
+    season.add_episode(Episode({"number": 1}))
+    show.add_season(season)
+
+    episode = pickle.loads(pickle.dumps(season.episodes[0]))  # noqa: S301
+    assert episode.parent is None
+    assert episode.item_id.parent_id is season.item_id
+    assert episode.log_string == "tt1405406/1E01"
+
+    restored = pickle.loads(pickle.dumps(show))  # noqa: S301
+    assert restored.seasons[0].parent is restored
+    assert restored.seasons[0].episodes[0].parent is restored.seasons[0]
+
+
+def test_streams_are_kept_as_bounded_compact_records():
+    episode = Episode({"number": 1})
+    torrents = [
+        _torrent(f"Show.S01E01.{resolution}.WEB-DL", rank, infohash * 40)
+        for resolution, rank, infohash in (("720p", 80, "a"), ("1080p", 90, "b"))
+    ]
+    episode.add_streams({torrents[0].infohash: torrents[0]}, limit=1)
+    episode.add_streams({torrents[1].infohash: torrents[1]}, limit=1)
+
+    assert list(episode.streams) == ["b" * 40]
+    stream = episode.streams["b" * 40]
+    assert isinstance(stream, Stream)
+    assert (stream.rank, stream.resolution, stream.episode) == (90, ("1080p",), (1,))
+
+    # items pickled with RTN models get compact records when they are loaded
+    legacy = Episode.__new__(Episode)
+    state = episode.__getstate__()
+    state["streams"] = {torrent.infohash: torrent for torrent in torrents}
+    legacy.__setstate__(state)
+    assert list(legacy.streams) == ["b" * 40, "a" * 40]
+    assert all(isinstance(stream, Stream) for stream in legacy.streams.values())
@@ -0,0 +1,12 @@
+"""Memory per episode of a large library, see `benchmarks/memory.py`"""
+
+from benchmarks.memory import episode_bytes, payload_bytes
+
+# an episode is compared to the JSON payload it is built from, so the budget
+# doesn't depend on the object sizes of the running Python version. Slotted
+# episodes take ~0.7 of their payload, the unslotted ones took twice as much.
+PAYLOAD_RATIO = 1
+
+
+def test_episodes_take_less_memory_than_their_payload():
+    assert episode_bytes(10_000) < PAYLOAD_RATIO * payload_bytes(10_000)
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+from program import parsing
+from program.media.stream import Stream
+from RTN import RTN
+from RTN.models import DefaultRanking, SettingsModel
+
+TITLES = [
+    ("The Walking Dead S05E03 720p HDTV x264-ASAP[ettv]", "c" * 40),
+    ("The Walking Dead S05E03 1080p WEB-DL x264", "d" * 40),
+    ("Unrelated Show S01E01 1080p WEB-DL", "e" * 40),
+    ("The Walking Dead S05E03 720p HDTV", "too short"),
+]
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss xmlns:torznab="http://torznab.com/schemas/2015/feed"><channel>
+<item><title>The Walking Dead S05E03 1080p WEB-DL x264</title>
+<torznab:attr name="seeders" value="10"/>
+<torznab:attr name="infohash" value="dddddddddddddddddddddddddddddddddddddddd"/></item>
+</channel></rss>"""
+
+
+@pytest.fixture(params=[0, 1], ids=["threads", "processes"])
+def workers(request):
+    parsing.start_workers(request.param)
+    yield
+    parsing.stop_workers()
+
+
+@pytest.mark.usefixtures("workers")
+def test_titles_are_ranked_into_compact_records():
+    rtn = RTN(SettingsModel(), DefaultRanking())
+
+    streams = parsing.rank_streams(rtn, TITLES, "The Walking Dead")
+    assert list(streams) == ["d" * 40, "c" * 40]
+    assert all(isinstance(stream, Stream) for stream in streams.values())
+    assert streams["d" * 40].resolution == ("1080p",)
+
+    streams, count = parsing.rank_torznab(rtn, FEED, "The Walking Dead")
+    assert list(streams) == ["d" * 40]
+    assert count == 1
+
+    episodes = parsing.season_episodes(["Show.S01E02.mkv", "Show.S01E03-E04.mkv"], 1)
+    assert episodes == {"Show.S01E02.mkv": [2], "Show.S01E03-E04.mkv": [3, 4]}
+
+
+def test_jobs_fall_back_to_threads_while_the_workers_stop():
+    parsing.start_workers(1)
+    filenames = [f"Show.S01E{number:02}.mkv" for number in range(1, 11)]
+    results, errors = [], []
+
+    def parse():
+        try:
+            for _ in range(5):
+                results.append(parsing.season_episodes(filenames, 1))
+        except Exception as error:  # noqa: BLE001
+            errors.append(error)
+
+    threads = [threading.Thread(target=parse) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    parsing.stop_workers()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(results) == 20
+    assert all(result["Show.S01E10.mkv"] == [10] for result in results)
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from utils import request
+from utils.request import RateLimiter, async_get
+
+
+def test_rate_limiter_waits_without_blocking_the_event_loop():
+    limiter = RateLimiter(max_calls=1, period=0.1)
+    ticks = []
+
+    async def call():
+        async with limiter:
+            return time.monotonic()
+
+    async def tick():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def main():
+        calls = await asyncio.gather(call(), call(), call(), tick())
+        return calls[:3]
+
+    first, second, third = sorted(asyncio.run(main()))
+    assert second - first >= 0.09
+    assert third - second >= 0.09
+    # the loop kept running while the calls waited
+    assert ticks[-1] - ticks[0] < 0.1
+
+
+def test_async_get_wraps_the_response(monkeypatch):
+    def handler(http_request):
+        if http_request.url.path == "/missing":
+            return httpx.Response(404)
+        return httpx.Response(200, json={"streams": [{"infoHash": "hash"}]})
+
+    monkeypatch.setattr(
+        request, "_async_client", httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    response = asyncio.run(async_get("http://torrentio/stream.json"))
+    assert response.is_ok
+    assert response.data.streams[0].infoHash == "hash"
+
+    with pytest.raises(request.requests.exceptions.RequestException):
+        asyncio.run(async_get("http://torrentio/missing"))
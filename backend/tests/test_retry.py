@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+from program.content import Overseerr
+from program.media.item import Episode, ItemId, Movie, Season, Show
+from program.media.state import States
+from program.retry import RETRY_INTERVAL, RetryScheduler, retry_roots
+from program.symlink import Symlinker
+
+
+def test_items_come_up_in_the_order_they_are_due():
+    retries = RetryScheduler()
+    now = datetime.now()
+    retries.schedule(ItemId("tt1"), now + timedelta(seconds=2))
+    retries.schedule(ItemId("tt2"), now + timedelta(seconds=1))
+    retries.schedule(ItemId("tt3"), now)
+    # rescheduling replaces the earlier time, None cancels
+    retries.schedule(ItemId("tt1"), now)
+    retries.schedule(ItemId("tt3"), None)
+
+    assert len(retries) == 2
+    assert retries.pop_due(now) == ItemId("tt1")
+    assert retries.pop_due(now) is None
+    assert retries.pop_due(now + timedelta(seconds=5)) == ItemId("tt2")
+    assert retries.pop_due(now + timedelta(seconds=5)) is None
+
+
+def _show(title=None) -> Show:
+    show = Show({"imdb_id": "tt1", "requested_by": Overseerr, "title": title})
+    for number in (1, 2):
+        season = Season({"number": number, "title": title})
+        for episode in (1, 2):
+            season.add_episode(Episode({"number": episode, "title": title}))
+        show.add_season(season)
+    return show
+
+
+def _tree(show: Show) -> list:
+    return [show, *show.seasons, *(e for season in show.seasons for e in season.episodes)]
+
+
+def test_collections_are_retried_from_their_minimal_roots():
+    # a show that isn't indexed yet is indexed as a whole
+    show = _show()
+    assert retry_roots(_tree(show)) == [show]
+
+    # any other show or season is retried through its incomplete episodes
+    show = _show("Show")
+    first, second = show.seasons
+    second.episodes[0].key = "plex"
+    due = [item for item in _tree(show) if item.state != States.Completed]
+    assert retry_roots(due) == [*first.episodes, second.episodes[1]]
+    assert retry_roots([second.episodes[1], first]) == [second.episodes[1], *first.episodes]
+
+    movie = Movie({"imdb_id": "tt2"})
+    assert retry_roots([movie]) == [movie]
+
+
+def _retried(program) -> list[str]:
+    program._retry_items()  # noqa: SLF001
+    events = []
+    while not program.event_queue.empty():
+        events.append(program.event_queue.get_nowait().item.imdb_id)
+    return events
+
+
+def test_only_due_items_are_retried(program):
+    requested = Movie({"imdb_id": "tt1", "requested_by": Overseerr})
+    # scraped three times, it waits for the after_2 tier
+    scraped = Movie({"imdb_id": "tt2", "title": "Movie", "aired_at": datetime(2000, 1, 1)})
+    scraped.scraped_at = datetime.now()
+    scraped.scraped_times = 3
+    program.media_items.upsert_many([requested, scraped, Movie({"imdb_id": "tt3", "key": "plex"})])
+
+    # on startup the items are retried right away, unless they wait to be scraped
+    assert _retried(program) == ["tt1"]
+    assert _retried(program) == []
+    assert program.retries.pop_due(datetime.now() + RETRY_INTERVAL) == requested.item_id
+
+    # a change reschedules the item, indexed items are scraped right away
+    requested.title = "Movie"
+    requested.aired_at = datetime(2000, 1, 1)
+    program.media_items.upsert(requested)
+    assert _retried(program) == ["tt1"]
+
+    program.media_items.remove(scraped)
+    _retried(program)
+    assert scraped.item_id not in program.retries
+
+
+def test_downloaded_shows_are_retried_through_their_episodes(program):
+    show = _show("Show")
+    for season in show.seasons:
+        for episode in season.episodes:
+            episode.file, episode.folder = "episode.mkv", "show"
+    assert show.state == States.Downloaded
+    program.media_items.upsert(show)
+
+    program._retry_items()  # noqa: SLF001
+    submitted = []
+    while not program.event_queue.empty():
+        service, items = program._process_event(program.event_queue.get_nowait())  # noqa: SLF001
+        assert service is Symlinker
+        submitted.extend(item.log_string for item in items)
+    assert sorted(submitted) == ["Show S01E01", "Show S01E02", "Show S02E01", "Show S02E02"]
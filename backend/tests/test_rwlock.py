@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+from utils.rwlock import ReadWriteLock
+
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = ReadWriteLock()
+    order = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    def read(name, started=None):
+        with lock.read():
+            if started:
+                started.set()
+                release.wait()
+            order.append(name)
+
+    def write():
+        with lock.write():
+            order.append("writer")
+
+    first = threading.Thread(target=read, args=("first", reading))
+    first.start()
+    reading.wait()
+    writer = threading.Thread(target=write)
+    writer.start()
+    while not lock._writers_waiting:  # noqa: SLF001
+        threading.Event().wait(0.001)
+    second = threading.Thread(target=read, args=("second",))
+    second.start()
+    release.set()
+    for thread in (first, writer, second):
+        thread.join()
+
+    assert order == ["first", "writer", "second"]
+
+
+def test_locks_are_reentrant_but_not_upgradable():
+    lock = ReadWriteLock()
+    with lock.write(), lock.write(), lock.read():
+        pass
+    with lock.read(), lock.read(), pytest.raises(RuntimeError):  # noqa: SIM117
+        with lock.write():
+            pass
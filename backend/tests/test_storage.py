@@ -0,0 +1,267 @@
+import os
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+import utils.utils
+from program.content import Overseerr
+from program.media import snapshot
+from program.media.container import MediaItemContainer
+from program.media.item import Episode, Movie, Season, Show
+from program.media.snapshot import GZIP_MAGIC, UnsupportedSnapshotError
+from program.media.state import States
+from program.media.storage import ColdStore, Journal, SqliteStore
+from program.types import Event
+from RTN import Torrent, parse
+from utils.utils import Pickly
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStore(tmp_path / "media.db")
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def test_show():
+    show = Show({"imdb_id": "tt1405406", "title": "The Vampire Diaries"})
+    for season_number in (1, 2):
+        season = Season({"number": season_number})
+        for episode_number in (1, 2):
+            season.add_episode(Episode({"number": episode_number}))
+        show.add_season(season)
+    return show
+
+
+def test_sqlite_store_round_trip(store, test_show):
+    container = MediaItemContainer()
+    container.use_store(store)
+    container.upsert(test_show)
+    container.upsert(Movie({"imdb_id": "tt0111161", "title": "Shawshank"}))
+
+    episode = test_show.seasons[1].episodes[0]
+    episode.key = "plex-key"
+    container.upsert(episode)
+
+    assert store.count(States.Completed) == 1
+    assert sorted(store.get_item_ids_with_state(States.PartiallyCompleted)) == [
+        "tt1405406",
+        "tt1405406/2",
+    ]
+    assert store.get_item_id_by_imdb_id("tt0111161") == "tt0111161"
+
+    loaded = MediaItemContainer()
+    loaded.use_store(store)
+    assert len(loaded) == len(container) == 8
+    loaded_show = loaded[test_show.item_id]
+    assert [s.number for s in loaded_show.seasons] == [1, 2]
+    assert loaded_show.seasons[1].episodes[0].key == "plex-key"
+    assert loaded_show.seasons[1].episodes[0].parent is loaded_show.seasons[1]
+    assert loaded_show.state == States.PartiallyCompleted
+    assert loaded.count(States.Completed) == 1
+    assert loaded.get_item_by_imdb_id("tt0111161").title == "Shawshank"
+
+
+def test_sqlite_store_remove(store, test_show):
+    container = MediaItemContainer()
+    container.use_store(store)
+    container.upsert(test_show)
+    container.remove(test_show.seasons[0])
+
+    loaded = MediaItemContainer()
+    loaded.use_store(store)
+    assert [s.number for s in loaded[test_show.item_id].seasons] == [2]
+    assert len(loaded) == 4
+
+
+def test_journal_replay_restores_changes(tmp_path, test_show):
+    container = MediaItemContainer()
+    container.store = Journal(tmp_path / "media.journal")
+    container.upsert_many(
+        [test_show, Movie({"imdb_id": "tt0111161", "title": "Shawshank"})]
+    )
+    episode = test_show.seasons[0].episodes[1]
+    episode.key = "plex-key"
+    container.upsert(episode)
+    container.remove("tt0111161")
+    container.store.close()
+
+    replayed = MediaItemContainer()
+    assert Journal(tmp_path / "media.journal").replay(replayed) == 4
+    assert len(replayed) == 7
+    assert replayed[episode.item_id].key == "plex-key"
+    assert replayed[episode.item_id].parent is replayed[episode.item_id.parent_id]
+    assert replayed.get_item_by_imdb_id("tt0111161") is None
+
+
+def test_journal_drops_torn_record(tmp_path, test_show):
+    journal = Journal(tmp_path / "media.journal")
+    journal.upsert(test_show)
+    journal.upsert(Movie({"imdb_id": "tt0111161"}))
+    journal.close()
+    torn_size = os.path.getsize(journal.filename) - 10
+    os.truncate(journal.filename, torn_size)
+
+    container = MediaItemContainer()
+    assert Journal(tmp_path / "media.journal").replay(container) == 1
+    assert test_show.item_id in container
+    assert os.path.getsize(journal.filename) < torn_size
+
+
+def test_pickly_compacts_journal_into_snapshot(tmp_path, test_show):
+    pickly = Pickly(MediaItemContainer(), tmp_path)
+    pickly.load()
+    pickly.media_items.upsert(test_show)
+    assert pickly.journal.size > 0
+
+    pickly.compact()
+    assert pickly.journal.size == 0
+    assert not os.path.exists(pickly.journal.rotated_filename)
+    pickly.journal.close()
+
+    restored = Pickly(MediaItemContainer(), tmp_path)
+    restored.load()
+    assert len(restored.media_items) == 7
+    restored.journal.close()
+
+
+def test_pickly_only_saves_changed_library(tmp_path, test_show):
+    pickly = Pickly(MediaItemContainer(), tmp_path)
+    pickly.load()
+    assert not pickly.save()
+
+    pickly.media_items.upsert(test_show)
+    assert pickly.save()
+    assert os.path.exists(tmp_path / "media.pkl")
+    assert not os.path.exists(tmp_path / "media.pkl.tmp")
+    assert not pickly.save()
+    pickly.journal.close()
+
+
+def test_pickly_saves_in_thread_when_the_snapshot_process_hangs(
+    tmp_path, test_show, monkeypatch
+):
+    monkeypatch.setattr(utils.utils, "SAVER_TIMEOUT", 0.2)
+    pickly = Pickly(MediaItemContainer(), tmp_path)
+    pickly.load()
+    hung = subprocess.Popen(["sleep", "60"])  # noqa: S603, S607
+    monkeypatch.setattr(pickly, "_fork_saver", lambda _filename: hung.pid)
+    pickly.media_items.upsert(test_show)
+
+    assert pickly.save()
+    assert hung.poll() is not None
+    assert os.path.exists(tmp_path / "media.pkl")
+    pickly.journal.close()
+
+
+def test_snapshot_round_trip_keeps_streams(tmp_path, test_show):
+    title = "The.Vampire.Diaries.S01E01.1080p.WEB-DL.x264-GRP"
+    torrent = Torrent(
+        raw_title=title, infohash="a" * 40, data=parse(title), rank=90, lev_ratio=1
+    )
+    test_show.seasons[0].episodes[0].streams[torrent.infohash] = torrent
+    container = MediaItemContainer()
+    container.upsert(test_show)
+    container.save(tmp_path / "media.pkl")
+
+    with open(tmp_path / "media.pkl", "rb") as file:
+        assert file.read(2) == GZIP_MAGIC
+
+    loaded = MediaItemContainer()
+    loaded.load(tmp_path / "media.pkl")
+    assert len(loaded) == 7
+    episode = loaded[test_show.seasons[0].episodes[0].item_id]
+    assert episode.streams[torrent.infohash].rank == 90
+    assert episode.streams[torrent.infohash].resolution == ("1080p",)
+
+
+def test_snapshots_of_other_versions_are_refused_and_kept(tmp_path, test_show, monkeypatch):
+    container = MediaItemContainer()
+    container.upsert(test_show)
+    monkeypatch.setattr(snapshot, "SNAPSHOT_VERSION", snapshot.SNAPSHOT_VERSION + 1)
+    container.save(tmp_path / "media.pkl")
+    monkeypatch.undo()
+
+    with pytest.raises(UnsupportedSnapshotError):
+        MediaItemContainer().load(tmp_path / "media.pkl")
+    assert os.path.exists(tmp_path / "media.pkl")
+
+
+def test_load_legacy_dill_snapshot():
+    # written by the MediaItemContainer.save of the unslotted item classes
+    loaded = MediaItemContainer()
+    loaded.load(FIXTURES / "legacy_media.pkl")
+    assert len(loaded) == 8
+    show = loaded.get_item_by_imdb_id("tt1405406")
+    assert show.title == "The Vampire Diaries"
+    assert show.seasons[0].episodes[0].key == "plex-key"
+    assert show.seasons[0].episodes[0].parent.parent is show
+    assert show.state == States.PartiallyCompleted
+    assert loaded.get_item_by_imdb_id("tt0111161").title == "Shawshank"
+
+
+def test_completed_items_are_evicted_to_the_cold_store(tmp_path, test_show):
+    container = MediaItemContainer()
+    container.use_cold_store(ColdStore(tmp_path / "media.cold"))
+    for season in test_show.seasons:
+        for episode in season.episodes:
+            episode.key = "plex-key"
+    container.upsert(test_show)
+    container.upsert(Movie({"imdb_id": "tt0111161", "title": "Shawshank"}))
+
+    listing = sorted(str(item.item_id) for item in container)
+    assert container.evict_completed() == 1
+    assert container.episodes == {}
+    # the seasons and episodes are listed and counted from their summaries
+    assert len(container) == 8
+    assert sorted(str(item.item_id) for item in container) == listing
+    assert container.count(States.Completed) == 7
+    completed = container.get_items_with_state(States.Completed)
+    assert len(completed) == 7
+    assert completed[test_show.item_id].to_dict()["title"] == "The Vampire Diaries"
+    season = completed[test_show.seasons[0].item_id]
+    assert season.to_dict() == test_show.seasons[0].to_dict()
+    assert container.peek(season.item_id) is season
+
+    # looking up an episode loads the whole show again
+    episode_id = test_show.seasons[1].episodes[0].item_id
+    assert container.get(episode_id).parent.parent.title == "The Vampire Diaries"
+    assert len(container.episodes) == 4
+    assert len(container) == 8
+    assert container.count(States.Completed) == 7
+    assert len(container.get_items_with_state(States.Completed)) == 7
+
+    container.evict_completed()
+    container.cold_store.close()
+    restored = MediaItemContainer()
+    restored.use_cold_store(ColdStore(tmp_path / "media.cold"))
+    assert len(restored) == 7
+    assert restored.get_item_by_imdb_id("tt1405406").title == "The Vampire Diaries"
+
+    restored.evict_completed()
+    restored.remove(test_show.item_id)
+    assert len(restored) == 0
+    assert list(restored.cold_store.summaries()) == []
+    restored.cold_store.close()
+
+
+def test_requests_for_cold_items_are_answered_from_the_summary(tmp_path, test_show, program):
+    program.media_items.use_cold_store(ColdStore(tmp_path / "media.cold"))
+    for season in test_show.seasons:
+        for episode in season.episodes:
+            episode.key = "plex-key"
+    test_show.indexed_at = datetime.now()
+    program.media_items.upsert(test_show)
+    program.media_items.evict_completed()
+
+    # overseerr yields the request again on every poll
+    request = Show({"imdb_id": "tt1405406", "requested_by": Overseerr})
+    assert request.item_id in program.media_items
+    assert program._process_event(Event(Overseerr, request)) == (None, [])  # noqa: SLF001
+    assert program.media_items.shows == {}
+    assert program.media_items.episodes == {}
+    program.media_items.cold_store.close()
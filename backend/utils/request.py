@@ -1,5 +1,6 @@
 """Requests wrapper"""
 
+import asyncio
 import json
 import logging
 import time
@@ -12,6 +13,11 @@ from lxml import etree
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+try:
+    import httpx
+except ImportError:  # only the asyncio engine needs it
+    httpx = None
+
 logger = logging.getLogger(__name__)
 
 _retry_strategy = Retry(
@@ -26,7 +32,9 @@ class ResponseObject:
 
     def __init__(self, response: requests.Response, response_type=SimpleNamespace):
         self.response = response
-        self.is_ok = response.ok
+        # requests and httpx responses both have a status code, but only
+        # requests responses have `ok`
+        self.is_ok = response.status_code < 400
         self.status_code = response.status_code
         self.response_type = response_type
         self.data = self.handle_response(response)
@@ -43,6 +51,9 @@ class ResponseObject:
                 logger.error("Error: %s %s", response.status_code, response.content)
             return {}
 
+        if self.response_type is bytes:
+            return response.content
+
         if response.content and "handler error" not in response.text:
             content_type = response.headers.get("Content-Type", "")
 
@@ -178,6 +189,36 @@ def delete(
     )
 
 
+_async_client = None
+
+
+def _get_async_client():
+    global _async_client  # noqa: PLW0603
+    if _async_client is None:
+        # connection errors are retried, like the requests adapter does
+        _async_client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(retries=5)
+        )
+    return _async_client
+
+
+async def async_get(
+    url: str,
+    timeout=10,
+    additional_headers=None,
+    response_type=SimpleNamespace,
+) -> ResponseObject:
+    """Async counterpart of `get` for the asyncio engine, using httpx."""
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    if additional_headers:
+        headers.update(additional_headers)
+    try:
+        response = await _get_async_client().get(url, headers=headers, timeout=timeout)
+    except httpx.HTTPError:
+        response = _handle_request_exception()
+    return ResponseObject(response, response_type)
+
+
 def _xml_to_simplenamespace(xml_string):
     root = etree.fromstring(xml_string)  # noqa: S320
 
@@ -218,6 +259,7 @@ class RateLimiter:
         limit_hit(): Resets the token count to 0, indicating that the rate limit has been hit.
         __enter__(): Enters the rate limiter context and checks if a call can be made.
         __exit__(): Exits the rate limiter context.
+        __aenter__(), __aexit__(): The same for coroutines, waiting without blocking the event loop.
 
     Raises:
         RateLimitExceeded: If the rate limit is exceeded and `raise_on_limit` is set to True.
@@ -237,9 +279,10 @@ class RateLimiter:
         """
         self.tokens = 0
 
-    def __enter__(self):
+    def _reserve(self) -> float:
         """
-        Enters the rate limiter context and checks if a call can be made.
+        Takes a call slot and returns how long to wait before making the call.
+        The slot is reserved under the lock, the caller waits outside of it.
         """
         with self.lock:
             current_time = time.time()
@@ -252,15 +295,34 @@ class RateLimiter:
                 if self.raise_on_limit:
                     raise RateLimitExceeded("Rate limit exceeded!")
                 time_to_sleep = self.period - time_since_last_call
-                time.sleep(time_to_sleep)
                 self.last_call = current_time + time_to_sleep
-            else:
-                self.tokens -= 1
-                self.last_call = current_time
+                return time_to_sleep
+            self.tokens -= 1
+            self.last_call = current_time
+            return 0
 
+    def __enter__(self):
+        """
+        Enters the rate limiter context and checks if a call can be made.
+        """
+        if (time_to_sleep := self._reserve()) > 0:
+            time.sleep(time_to_sleep)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         """
         Exits the rate limiter context.
         """
+
+    async def __aenter__(self):
+        """
+        Enters the rate limiter context from a coroutine, awaiting instead of sleeping.
+        """
+        if (time_to_sleep := self._reserve()) > 0:
+            await asyncio.sleep(time_to_sleep)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        """
+        Exits the rate limiter context.
+        """
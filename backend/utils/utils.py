@@ -1,13 +1,40 @@
 import os
+import signal
 import threading
 import time
 
+from program.media.storage import Journal
+from program.settings.manager import settings_manager
+from utils.logger import logger
+
+# how long the snapshot process may take before it is killed, and how often
+# it is checked on
+SAVER_TIMEOUT = 600
+SAVER_POLL_INTERVAL = 0.1
+
 
 class Pickly(threading.Thread):
+    """Persists the media items as a snapshot plus a journal of the changes made
+    since. The journal is folded into a new snapshot once it grows past
+    `storage.journal_compaction_mb`.
+
+    Snapshots are only taken when the container's generation changed since the
+    last one. They are written by a forked child process that serializes its
+    copy-on-write image of the library, so neither the event loop nor the
+    workers wait for it and the child never sees the library change mid-dump.
+    A child that doesn't finish within `SAVER_TIMEOUT`, e.g. stuck on a lock
+    another thread held when it was forked, is killed and the snapshot is
+    saved in this thread instead.
+    """
+
     def __init__(self, media_items, data_path: str):
         super().__init__(name="Pickly")
         self.media_items = media_items
         self.data_path = data_path
+        self.journal = None
+        self.saved_generation = None
+        self.compaction_lock = threading.Lock()
+        self.stopped = threading.Event()
         self.running = False
 
     def start(self) -> None:
@@ -16,20 +43,87 @@ class Pickly(threading.Thread):
         return super().start()
 
     def stop(self) -> None:
-        self.save()
         self.running = False
+        self.stopped.set()
+        self.compact()
+        self.media_items.store = None
+        self.journal.close()
 
     def load(self) -> None:
         self.media_items.load(os.path.join(self.data_path, "media.pkl"))
+        self.saved_generation = self.media_items.generation
+        self.journal = Journal(os.path.join(self.data_path, "media.journal"))
+        if replayed := self.journal.replay(self.media_items):
+            logger.info("Replayed %s journaled media changes", replayed)
+        self.media_items.store = self.journal
+
+    def save(self) -> bool:
+        """Snapshot the media items if they changed since the last snapshot."""
+        filename = os.path.join(self.data_path, "media.pkl")
+        # fork while holding the read lock, so the child's image of the library
+        # isn't caught halfway through a change
+        with self.media_items.lock.read():
+            generation = self.media_items.generation
+            if generation == self.saved_generation:
+                return False
+            pid = self._fork_saver(filename)
+        if pid is None or not self._wait_for_saver(pid):
+            self.media_items.save(filename)
+        self.saved_generation = generation
+        return True
 
-    def save(self) -> None:
-        self.media_items.save(os.path.join(self.data_path, "media.pkl"))
+    def _fork_saver(self, filename) -> int | None:
+        """Fork a child that saves the media items, returns None if forking isn't
+        possible."""
+        if not hasattr(os, "fork"):
+            return None
+        try:
+            pid = os.fork()
+        except OSError as e:
+            logger.error("Failed to fork for snapshot, saving in thread: %s", e)
+            return None
+        if pid == 0:
+            # Child process: only this thread exists here, and locks held by
+            # other threads at fork time stay locked, so don't log or return.
+            # This thread holds the container's read lock, saving reenters it.
+            exit_code = 1
+            try:
+                self.media_items.save(filename)
+                exit_code = 0
+            finally:
+                os._exit(exit_code)
+        return pid
+
+    def _wait_for_saver(self, pid: int) -> bool:
+        deadline = time.monotonic() + SAVER_TIMEOUT
+        while True:
+            finished, status = os.waitpid(pid, os.WNOHANG)
+            if finished:
+                break
+            if time.monotonic() >= deadline:
+                logger.error("Snapshot process timed out, saving in thread")
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                return False
+            time.sleep(SAVER_POLL_INTERVAL)
+        if (exit_code := os.waitstatus_to_exitcode(status)) != 0:
+            logger.error("Snapshot process exited with %s, saving in thread", exit_code)
+            return False
+        return True
+
+    def compact(self) -> None:
+        """Fold the journal into a new snapshot."""
+        with self.compaction_lock:
+            if self.media_items.generation == self.saved_generation:
+                return
+            self.journal.rotate()
+            self.save()
+            self.journal.discard_rotated()
+            logger.debug("Compacted media journal into a new snapshot")
 
     def run(self):
         while self.running:
-            self.save()
-            # workaround for quick shutdown, we should use threading.Event instead
-            for i in range(10):
-                if not self.running:
-                    break
-                time.sleep(i)
+            limit = settings_manager.settings.storage.journal_compaction_mb
+            if self.journal.size >= limit * 1024 * 1024:
+                self.compact()
+            self.stopped.wait(5)